@@ -0,0 +1,200 @@
+"""大整数进制转换。
+
+CPython 的 str(int) / int(str) 在十进制下是平方复杂度，并且超过
+sys.get_int_max_str_digits() 时直接抛出 ValueError。这里对十进制使用
+分治算法（幂表只在单次转换内缓存），对 2/8/16 进制使用内置的线性时间实现。
+"""
+import decimal
+from typing import Iterator
+
+# 低于该位数时直接使用内置转换（保证不超过最小的 int_max_str_digits=640）
+_DIRECT_BITS = 2000
+_DIRECT_DIGITS = 600
+
+_POWER_OF_TWO_BASES = {2: "b", 8: "o", 16: "x"}
+
+
+def int_to_string(value: int, base: int = 10) -> str:
+    """将整数转换为指定进制的字符串（十六进制为大写，不带前缀）"""
+    if value < 0:
+        return "-" + int_to_string(-value, base)
+
+    if base in _POWER_OF_TWO_BASES:
+        return format(value, _POWER_OF_TWO_BASES[base]).upper()
+    if base != 10:
+        raise ValueError(f"Unsupported base: {base}")
+    if value.bit_length() <= _DIRECT_BITS:
+        return str(value)
+    return _int_to_decimal_string(value)
+
+
+def iter_int_string(value: int, base: int = 10, chunk_digits: int = 1 << 16) -> Iterator[str]:
+    """按从高到低的顺序分块产出整数的文本（与 int_to_string 相同），不构造完整字符串。
+
+    在块边界处把数拆成高低两半递归产出，低半部分左侧补零：2/8/16 进制用移位拆分，
+    十进制先分治转换为 Decimal，再按 10 的幂拆分（只改指数并取整，线性时间）。
+    """
+    if value < 0:
+        yield "-"
+        value = -value
+
+    if base in _POWER_OF_TWO_BASES:
+        digit_bits = {2: 1, 8: 3, 16: 4}[base]
+        code = _POWER_OF_TWO_BASES[base]
+        number = value
+        total = max((value.bit_length() + digit_bits - 1) // digit_bits, 1)
+
+        def split(n, digits):
+            shift = digits * digit_bits
+            return n >> shift, n & ((1 << shift) - 1)
+
+        def text(n):
+            return format(n, code).upper()
+    elif base == 10:
+        if value.bit_length() <= _DIRECT_BITS:
+            yield str(value)
+            return
+        ctx = _exact_context()
+        number = _int_to_decimal(value, ctx)
+        total = number.adjusted() + 1
+
+        def split(n, digits):
+            high = ctx.to_integral_value(ctx.scaleb(n, -digits))
+            return high, ctx.subtract(n, ctx.scaleb(high, digits))
+
+        text = str
+    else:
+        raise ValueError(f"Unsupported base: {base}")
+
+    def emit(n, width, pad):
+        chunks = -(-width // chunk_digits)
+        if chunks <= 1:
+            piece = text(n)
+            yield piece.zfill(width) if pad else piece
+            return
+        low_digits = (chunks >> 1) * chunk_digits
+        high, low = split(n, low_digits)
+        yield from emit(high, width - low_digits, pad)
+        yield from emit(low, low_digits, True)
+
+    yield from emit(number, total, False)
+
+
+def string_to_int(text: str, base: int = 10) -> int:
+    """将指定进制的字符串解析为整数，允许前导正负号与首尾空白"""
+    text = text.strip()
+    if text and text[0] in "+-":
+        sign = -1 if text[0] == "-" else 1
+        return sign * string_to_int(text[1:], base)
+
+    if base != 10 or len(text) <= _DIRECT_DIGITS:
+        return int(text, base)
+    if not text.isascii() or not text.isdigit():
+        raise ValueError(f"invalid literal for base 10: {text[:20]!r}")
+    return _decimal_string_to_int(text)
+
+
+def leading_digits(value: int, count: int, base: int = 10) -> tuple[str, int]:
+    """返回正整数的前 count 位数字（截断，不四舍五入）与总位数，不做完整转换。
+
+    2/8/16 进制直接移位取高位。十进制用 128 位高位乘以 2 的幂做近似
+    （decimal 中按 count 加余量的精度计算）；近似值在第 count 位之后出现
+    连续的 0 或 9、可能影响结果时，改用精确的整数除法。
+    """
+    bits = value.bit_length()
+    if base in _POWER_OF_TWO_BASES:
+        digit_bits = {2: 1, 8: 3, 16: 4}[base]
+        total = (bits + digit_bits - 1) // digit_bits
+        shift = max(total - count, 0) * digit_bits
+        return int_to_string(value >> shift, base), total
+    if base != 10:
+        raise ValueError(f"Unsupported base: {base}")
+    if bits <= _DIRECT_BITS:
+        text = str(value)
+        return text[:count], len(text)
+
+    shift = bits - 128
+    with decimal.localcontext() as ctx:
+        ctx.prec = count + 20
+        ctx.Emax = decimal.MAX_EMAX
+        ctx.Emin = decimal.MIN_EMIN
+        approx = decimal.Decimal(value >> shift) * decimal.Decimal(2) ** shift
+    sign, digits, exponent = approx.as_tuple()
+    text = "".join(map(str, digits))
+    total = len(digits) + exponent
+    guard = text[count:count + 12]
+    if guard.strip("0") and guard.strip("9"):
+        return text[:count], total
+
+    # 近似值处于进位边界附近：精确计算总位数与前 count 位
+    powers = {}
+    if value < _pow10(total - 1, powers):
+        total -= 1
+    elif value >= _pow10(total, powers):
+        total += 1
+    return str(value // _pow10(total - count, powers)), total
+
+
+def _pow10(exponent: int, cache: dict) -> int:
+    """10 的幂，按二分结构递归；cache 只在一次转换内有效，分治过程中反复用到相同的指数"""
+    if exponent <= 64:
+        return 10 ** exponent
+    result = cache.get(exponent)
+    if result is None:
+        half = exponent >> 1
+        result = _pow10(half, cache) * _pow10(half, cache)
+        if exponent & 1:
+            result *= 10
+        cache[exponent] = result
+    return result
+
+
+def _decimal_string_to_int(text: str) -> int:
+    """分治：int(高位) * 10**len(低位) + int(低位)，乘法使用 Karatsuba"""
+    powers = {}
+
+    def convert(start: int, stop: int) -> int:
+        if stop - start <= _DIRECT_DIGITS:
+            return int(text[start:stop])
+        mid = stop - ((stop - start) >> 1)
+        return convert(start, mid) * _pow10(stop - mid, powers) + convert(mid, stop)
+
+    return convert(0, len(text))
+
+
+def _int_to_decimal_string(value: int) -> str:
+    """分治转换为 Decimal 后输出字符串"""
+    return str(_int_to_decimal(value, _exact_context()))
+
+
+def _exact_context() -> decimal.Context:
+    """不限精度、不允许舍入的 Decimal 上下文（显式传递，不修改线程的当前上下文）"""
+    return decimal.Context(
+        prec=decimal.MAX_PREC,
+        Emax=decimal.MAX_EMAX,
+        Emin=decimal.MIN_EMIN,
+        rounding=decimal.ROUND_DOWN,
+        traps=[decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow, decimal.Inexact],
+    )
+
+
+def _int_to_decimal(value: int, ctx: decimal.Context) -> decimal.Decimal:
+    """分治：按二进制位数拆分整数，在 decimal 中组合（libmpdec 的大数乘法为次平方）"""
+    D = decimal.Decimal
+    pow2_cache = {}
+
+    def pow2(bits: int):
+        result = pow2_cache.get(bits)
+        if result is None:
+            result = pow2_cache[bits] = ctx.power(D(2), bits)
+        return result
+
+    def convert(n: int, bits: int):
+        if bits <= _DIRECT_BITS:
+            return D(str(n))
+        half = bits >> 1
+        high = n >> half
+        low = n - (high << half)
+        return ctx.add(ctx.multiply(convert(high, bits - half), pow2(half)), convert(low, half))
+
+    return convert(value, value.bit_length())
@@ -0,0 +1,289 @@
+"""无界面基准测试：测量模型、格式化、进制转换与按键处理路径的吞吐与延迟分位数。
+
+用法：
+    python bench.py run [-o bench.json] [--quick] [-k 名称片段]
+    python bench.py compare old.json new.json [--threshold 0.10]
+
+compare 以 p50 为准，新结果比旧结果慢超过阈值的用例记为回归，存在回归时退出码为 1。
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import formatter
+from controller import CalculatorController
+from core import CalculatorCore
+from model import CalculatorModel
+from workspace import Workspace
+
+# 每个用例的默认计时预算（秒）与最大采样次数
+_CASE_SECONDS = 1.0
+_MAX_SAMPLES = 20000
+
+
+class FakeView:
+    """模拟 CalculatorView 的最小接口，after 任务在 flush 时执行"""
+
+    def __init__(self):
+        self.text = "0"
+        self.sub_text = ""
+        self._jobs = {}
+        self._next_job = 0
+
+    def get_display_text(self):
+        return self.text
+
+    def update_display(self, main_text, sub_text=None, cursor=None):
+        self.text = main_text
+        if sub_text is not None:
+            self.sub_text = sub_text
+
+    def update_sub_label(self, text):
+        self.sub_text = text
+
+    def after(self, ms, func, *args):
+        self._next_job += 1
+        self._jobs[self._next_job] = (func, args)
+        return self._next_job
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, job):
+        self._jobs.pop(job, None)
+
+    def flush(self):
+        while self._jobs:
+            func, args = self._jobs.pop(min(self._jobs))
+            func(*args)
+
+    def __getattr__(self, name):
+        # resize_window、setup_*_buttons 等纯界面调用在基准中不做任何事
+        return lambda *args, **kwargs: None
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(func, seconds=_CASE_SECONDS, max_samples=_MAX_SAMPLES):
+    """反复调用 func，返回吞吐与延迟分位数（延迟单位：微秒）"""
+    func()  # 预热
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < max_samples:
+        start = time.perf_counter()
+        func()
+        end = time.perf_counter()
+        samples.append(end - start)
+        if end >= deadline and len(samples) >= 5:
+            break
+
+    samples.sort()
+    total = sum(samples)
+    return {
+        "samples": len(samples),
+        "ops_per_sec": len(samples) / total if total else 0.0,
+        "mean_us": total / len(samples) * 1e6,
+        "p50_us": _percentile(samples, 0.50) * 1e6,
+        "p90_us": _percentile(samples, 0.90) * 1e6,
+        "p99_us": _percentile(samples, 0.99) * 1e6,
+    }
+
+
+def build_cases(quick=False):
+    """返回 [(名称, 无参可调用对象)]"""
+    rng = random.Random(1234)
+    cases = []
+
+    # --- CalculatorModel.evaluate：关闭缓存测量完整的解析与求值 ---
+    cold = CalculatorModel(cache_size=0)
+    warm = CalculatorModel()
+    expressions = {
+        "shallow": "12+34*5-6",
+        "deep": "(" * 100 + "1" + "+1)" * 100,
+        "wide": "+".join(f"{i}*{i % 7 + 1}-{i % 5}" for i in range(200)),
+    }
+    for mode in ("Standard", "Programmer"):
+        for shape, expr in expressions.items():
+            cases.append((f"evaluate/{mode}/{shape}", lambda e=expr, m=mode: cold.evaluate(e, m)))
+        cases.append((f"evaluate/{mode}/shallow-cached", lambda m=mode: warm.evaluate("12+34*5-6", m)))
+    cases.append(("evaluate/Programmer/HEX/shallow",
+                  lambda: cold.evaluate("1F+A0*3-E<<2", "Programmer", base=16)))
+    cases.append(("evaluate/Programmer/QWORD/deep",
+                  lambda: cold.evaluate(expressions["deep"], "Programmer", 64, True)))
+    cases.append(("evaluate/Programmer/QWORD/shift-chain",
+                  lambda: cold.evaluate("+".join(["(1<<1000)*3"] * 50), "Programmer", 64, True)))
+
+    # --- sort_numbers / format_sorted_numbers / aggregate_numbers ---
+    sizes = (1_000, 10_000, 100_000) if quick else (1_000, 10_000, 100_000, 1_000_000)
+    for size in sizes:
+        values = [rng.randint(-10**9, 10**9) if i % 4 else rng.uniform(-1e6, 1e6) for i in range(size)]
+        text = ",".join(str(v) for v in values)
+        numbers = sorted(values)
+        cases.append((f"sort_numbers/{size}", lambda t=text: cold.sort_numbers(t)))
+        cases.append((f"format_sorted_numbers/{size}", lambda n=numbers: formatter.format_sorted_numbers(n)))
+        for func, arg in (("median", None), ("percentile", 90), ("top", 10), ("mean", None)):
+            cases.append((f"aggregate_numbers/{func}/{size}",
+                          lambda t=text, f=func, a=arg: cold.aggregate_numbers(t, f, a)))
+
+    # --- convert_time ---
+    cases.append(("convert_time/hours", lambda: cold.convert_time("2.5h")))
+    cases.append(("convert_time/minutes", lambda: cold.convert_time("135m")))
+    cases.append(("convert_time/compound", lambda: cold.convert_time("2.5h 15m")))
+    durations = ",".join(f"{rng.randint(0, 9)}h{rng.randint(0, 59)}m" if i % 4 == 0 else f"{rng.uniform(0, 600):.1f}m"
+                         for i in range(100_000))
+    time_core = CalculatorCore(cold)
+    time_core.mode = "Time"
+    cases.append(("convert_times/100000", lambda: "".join(time_core.stream_time(durations)[0])))
+
+    # --- format_result ---
+    cases.append(("format_result/int", lambda: formatter.format_result(123456789)))
+    cases.append(("format_result/float", lambda: formatter.format_result(2 / 3)))
+    cases.append(("format_result/bigint", lambda: formatter.format_result(7 ** 2000)))
+    huge = 3 ** 1_000_000
+    cases.append(("format_result/huge", lambda: formatter.format_result(huge)))
+    if not quick:
+        cases.append(("iter_full_result/huge", lambda: sum(map(len, formatter.iter_full_result(huge)))))
+
+    # --- 进制转换往返 ---
+    core = CalculatorCore(cold)
+    core.mode = "Programmer"
+    for digits in (16, 1_000, 20_000):
+        hex_expr = "".join(rng.choice("0123456789ABCDEF") for _ in range(digits)).lstrip("0") or "1"
+        hex_expr = f"{hex_expr}+FF<<3"
+
+        def round_trip(e=hex_expr):
+            dec = core._convert_expression_base(e, "HEX", "DEC")
+            return core._convert_expression_base(dec, "DEC", "HEX")
+        cases.append((f"convert_base/HEX-DEC-HEX/{digits}", round_trip))
+
+    # --- 命名变量：修改一个输入，只重新计算依赖它的公式 ---
+    workspace = Workspace(CalculatorModel())
+    for i in range(20):
+        workspace.define(f"in{i}", str(i + 1))
+    for i in range(500):
+        workspace.define(f"f{i}", f"in{i % 20}*{i}+in{(i * 7) % 20}")
+    counter = iter(range(1 << 62))
+    cases.append(("workspace/redefine-input", lambda: workspace.define("in3", str(next(counter)))))
+
+    # --- 重复运算：闭式解与次数无关 ---
+    cases.append(("iterate/add/1e9", lambda: cold.iterate(7, "+", 3, 10**9, "Standard")))
+    cases.append(("iterate/QWORD/mul/1e9", lambda: cold.iterate(7, "*", 3, 10**9, "Programmer", 64, True)))
+    cases.append(("iterate/modulus/1e6", lambda: cold.iterate(7, "*", 3, 10**6, "Standard", modulus=10**9 + 7)))
+
+    # --- 完整的按键处理路径：逐键输入、按 "=" 并执行预览任务 ---
+    keys = list("123+456*7-89/3") + ["="]
+
+    def keystrokes(mode, key_seq):
+        view = FakeView()
+        controller = CalculatorController(CalculatorModel(), view, background=False)
+        controller.mode = mode
+
+        def run():
+            controller.handle_button_click("CLEAR")
+            for key in key_seq:
+                controller.handle_button_click(key)
+            view.flush()
+        return run
+    cases.append(("keystrokes/Standard", keystrokes("Standard", keys)))
+    cases.append(("keystrokes/Programmer", keystrokes("Programmer", keys)))
+    long_keys = list("+".join(str(i) for i in range(1, 400))) + ["="]
+    cases.append(("keystrokes/Standard/long", keystrokes("Standard", long_keys)))
+
+    def paste(text):
+        view = FakeView()
+        controller = CalculatorController(CalculatorModel(), view, background=False)
+
+        def run():
+            controller.handle_button_click("CLEAR")
+            controller.handle_paste(text)
+            view.flush()
+        return run
+    cases.append(("paste/Standard/long", paste("".join(long_keys[:-1]))))
+
+    return cases
+
+
+def run(args):
+    results = {}
+    for name, func in build_cases(args.quick):
+        if args.k and args.k not in name:
+            continue
+        stats = measure(func, seconds=args.seconds)
+        results[name] = stats
+        print(
+            f"{name:<40} {stats['ops_per_sec']:>12.1f} ops/s  "
+            f"p50 {stats['p50_us']:>10.1f} us  p99 {stats['p99_us']:>10.1f} us",
+            flush=True,
+        )
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"已保存到 {args.output}")
+    return 0
+
+
+def compare(args):
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)["results"]
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    for name in sorted(old.keys() & new.keys()):
+        before = old[name]["p50_us"]
+        after = new[name]["p50_us"]
+        ratio = after / before if before else 1.0
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  <-- 回归"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "  (提升)"
+        print(f"{name:<40} {before:>10.1f} -> {after:>10.1f} us  x{ratio:.2f}{flag}")
+
+    for name in sorted(old.keys() - new.keys()):
+        print(f"{name:<40} 仅存在于旧结果")
+    for name in sorted(new.keys() - old.keys()):
+        print(f"{name:<40} 仅存在于新结果")
+
+    print(f"{regressions} 个用例回归（阈值 {args.threshold:.0%}）")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="计算器基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="运行基准测试并保存 JSON 结果")
+    run_parser.add_argument("-o", "--output", default="bench.json")
+    run_parser.add_argument("--quick", action="store_true", help="跳过 1e6 规模的用例")
+    run_parser.add_argument("--seconds", type=float, default=_CASE_SECONDS, help="每个用例的计时预算")
+    run_parser.add_argument("-k", help="只运行名称包含该片段的用例")
+
+    compare_parser = sub.add_parser("compare", help="比较两次结果并标记回归")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="p50 变慢超过该比例视为回归")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
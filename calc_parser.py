@@ -0,0 +1,172 @@
+"""计算器专用的分词器与 Pratt 解析器。
+
+只识别计算器语法：数字、变量名、+ - * / % & | ^ << >> ~ 与括号，运算符
+优先级与结合性与 Python 相同。数字按给定进制直接读取（HEX/OCT/BIN 下不再
+先改写为十进制）。解析是单遍的：每识别出一个结构就交给构造器（builder）
+生成结果，不构造中间语法树。构造器需提供：
+
+    constant(value)              数字字面量（为 None 时数字原样作为结果）
+    name(text)                   变量名（不允许变量时应抛出 ValueError）
+    unary(op_type, operand)      一元运算，op_type 为 ast.UAdd / ast.USub / ast.Invert
+    chain(first, steps)          左结合的运算链 first op1 x1 op2 x2 ...，
+                                 steps 为 [(op_type, x), ...]，op_type 为 ast.Add 等
+
+同一层级上的运算链在循环中收集，调用栈只随括号与一元运算的嵌套加深；
+嵌套超过 MAX_DEPTH 层时抛出 ValueError，而不是耗尽解释器栈。
+"""
+import ast
+import re
+import string
+
+import baseconv
+
+# 括号与一元运算的最大嵌套层数
+MAX_DEPTH = 500
+# 不超过该位数的十进制整数直接用 int() 解析
+_DIRECT_DIGITS = 600
+
+NUMBER = "number"
+NAME = "name"
+OP = "op"
+
+_NUMBER_PATTERNS = {
+    # 十进制也接受 Python 风格的 0x/0o/0b 前缀与数字间的下划线（如 1_000）
+    10: r"0[xX][0-9A-Fa-f_]+|0[oO][0-7_]+|0[bB][01_]+|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?",
+    16: r"[0-9A-Fa-f]+",
+    8: r"[0-7]+",
+    2: r"[01]+",
+}
+# 数字的首字符；十六进制下字母都是数字，因此只有十进制识别变量名
+_NUMBER_START = {10: string.digits + ".", 16: string.hexdigits, 8: string.octdigits, 2: "01"}
+_NAME_START = frozenset(string.ascii_letters + "_")
+
+# 二元运算符：(绑定力, ast 运算符类型)，数值越大结合越紧
+_BINARY = {
+    "|": (1, ast.BitOr),
+    "^": (2, ast.BitXor),
+    "&": (3, ast.BitAnd),
+    "<<": (4, ast.LShift),
+    ">>": (4, ast.RShift),
+    "+": (5, ast.Add),
+    "-": (5, ast.Sub),
+    "*": (6, ast.Mult),
+    "/": (6, ast.Div),
+    "%": (6, ast.Mod),
+}
+_UNARY = {"+": ast.UAdd, "-": ast.USub, "~": ast.Invert}
+_UNARY_BINDING = 7
+
+_scanners = {}
+
+
+def _scanner(base: int):
+    """每个记号一个分组；无法识别的单个字符也作为记号返回，由调用方报错"""
+    scanner = _scanners.get(base)
+    if scanner is None:
+        if base not in _NUMBER_PATTERNS:
+            raise ValueError(f"Unsupported base: {base}")
+        name = r"|[A-Za-z_]\w*" if base == 10 else ""
+        scanner = _scanners[base] = re.compile(
+            rf"\s*({_NUMBER_PATTERNS[base]}{name}|<<|>>|[-+*/%&|^~()]|\S)"
+        )
+    return scanner
+
+
+def tokenize(text: str, base: int = 10) -> list[tuple[str, object, int, int]]:
+    """把表达式切分为 (类型, 值, 起始位置, 结束位置) 列表。
+
+    数字按 base 进制解析为 int（十进制下带小数点或指数的为 float），
+    变量名与运算符的值为原文；遇到无法识别的字符时抛出 ValueError。
+    """
+    tokens = []
+    number_start = _NUMBER_START[base] if base in _NUMBER_START else ""
+    for match in _scanner(base).finditer(text):
+        token = match.group(1)
+        if token[0] in number_start:
+            kind, value = NUMBER, _number(token, base)
+        elif base == 10 and token[0] in _NAME_START:
+            kind, value = NAME, token
+        elif token in _BINARY or token in _UNARY or token in "()":
+            kind, value = OP, token
+        else:
+            raise ValueError(f"无效字符: {token!r}")
+        tokens.append((kind, value, match.start(1), match.end(1)))
+    return tokens
+
+
+def _number(token: str, base: int):
+    if base != 10:
+        return int(token, base)
+    if token.isdigit():
+        return baseconv.string_to_int(token) if len(token) > _DIRECT_DIGITS else int(token)
+    if token[0] == "0" and token[1:2] in ("x", "X", "o", "O", "b", "B"):
+        return int(token, 0)
+    if "." in token or "e" in token or "E" in token:
+        return float(token)
+    return int(token)  # 带下划线分隔的整数
+
+
+def parse(text: str, base: int, builder):
+    """解析表达式，返回构造器为整个表达式生成的结果"""
+    scanner = _scanners.get(base) or _scanner(base)
+    tokens = scanner.findall(text)
+    tokens += ("", "")  # 结束标记（右操作数的快速路径会多看一个记号）
+    number_start = _NUMBER_START[base]
+    names = decimal = base == 10
+    constant, name, unary, chain = builder.constant, builder.name, builder.unary, builder.chain
+    pos = 0
+
+    def expression(min_binding, depth):
+        """解析一个操作数及其后绑定力大于 min_binding 的运算"""
+        nonlocal pos
+        if depth > MAX_DEPTH:
+            raise ValueError(f"表达式嵌套超过 {MAX_DEPTH} 层")
+        token = tokens[pos]
+        pos += 1
+        if not token:
+            raise ValueError("语法错误")
+        if token[0] in number_start:
+            # 常见的短十进制整数直接 int()，不经过 _number
+            left = int(token) if decimal and token.isdigit() and len(token) <= _DIRECT_DIGITS else _number(token, base)
+            if constant is not None:
+                left = constant(left)
+        elif token == "(":
+            left = expression(0, depth + 1)
+            if tokens[pos] != ")":
+                raise ValueError("括号不匹配")
+            pos += 1
+        elif token in _UNARY:
+            left = unary(_UNARY[token], expression(_UNARY_BINDING, depth + 1))
+        elif names and token[0] in _NAME_START:
+            left = name(token)
+        else:
+            raise ValueError("语法错误")
+
+        # 右操作数会吸收所有结合更紧的运算，因此这里收集到的运算都向左结合
+        steps = None
+        while True:
+            entry = _BINARY.get(tokens[pos])
+            if entry is None or entry[0] <= min_binding:
+                break
+            binding = entry[0]
+            token = tokens[pos + 1]
+            following = _BINARY.get(tokens[pos + 2])
+            if token and token[0] in number_start and (following is None or following[0] <= binding):
+                # 右操作数是单个数字且其后没有结合更紧的运算：不必递归
+                pos += 2
+                right = int(token) if decimal and token.isdigit() and len(token) <= _DIRECT_DIGITS else _number(token, base)
+                if constant is not None:
+                    right = constant(right)
+            else:
+                pos += 1
+                right = expression(binding, depth + 1)
+            if steps is None:
+                steps = [(entry[1], right)]
+            else:
+                steps.append((entry[1], right))
+        return left if steps is None else chain(left, steps)
+
+    result = expression(0, 1)
+    if tokens[pos]:
+        raise ValueError("语法错误")
+    return result
@@ -0,0 +1,47 @@
+"""检查计算核心的导入开销：核心模块不得（间接）导入 Tk / customtkinter，也不得在导入时加载可选的 NumPy。
+
+用法：python check_imports.py
+借助 `python -X importtime` 记录导入的全部模块，发现上述模块时以非零状态退出。
+"""
+import subprocess
+import sys
+
+# 只依赖标准库的核心模块，以及 --batch 路径实际使用的入口
+CORE_MODULES = ["model", "formatter", "core", "controller", "main", "server"]
+FORBIDDEN = ("tkinter", "_tkinter", "customtkinter", "view", "numpy")
+
+
+def imported_modules(modules):
+    """在新的解释器中导入 modules，返回 importtime 记录到的模块名及累计耗时（微秒）"""
+    code = "; ".join(f"import {name}" for name in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr)
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cumulative.isdigit():
+            timings[name] = int(cumulative)
+    return timings
+
+
+def main():
+    timings = imported_modules(CORE_MODULES)
+    offenders = sorted(name for name in timings if name.split(".")[0] in FORBIDDEN)
+    total = sum(timings[name] for name in CORE_MODULES if name in timings)
+    if offenders:
+        print(f"核心模块导入了界面库或 NumPy: {', '.join(offenders)}")
+        return 1
+    print(f"OK: 核心模块未导入界面库或 NumPy（{total / 1000:.1f} ms）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,66 @@
-import re
+import multiprocessing
+import time
+
 import formatter
+from core import CalculatorCore, run_equals_in_worker
+from metrics import METRICS
+from model import WORD_SIZES
+
+# 实时预览的防抖间隔（毫秒）
+_PREVIEW_DELAY_MS = 120
+# 后台计算：首次检查结果的延迟，此后间隔逐次翻倍直到上限（毫秒）；等待超过 _PENDING_LABEL_MS 时提示计算中
+_FIRST_POLL_MS = 1
+_POLL_MS = 50
+_PENDING_LABEL_MS = 30
+# 上下键浏览历史时一次取回的最多匹配条数
+_HISTORY_RECALL_LIMIT = 200
+
+
+class CalculatorController(CalculatorCore):
+    """在 CalculatorCore 的计算逻辑之上处理视图事件"""
 
-class CalculatorController:
-    def __init__(self, model, view):
-        self.model = model
+    def __init__(self, model, view, background=True):
+        super().__init__(model)
         self.view = view
-        
-        # 应用状态
-        self.mode = "Standard" # "Standard" or "Programmer" or "Time"
-        self.current_base = "DEC" # "HEX", "DEC", "OCT", "BIN"
-        self.last_expression = None  # 存储上一次的表达式
-        self.is_result_displayed = False  # showing result flag
-        self.last_operator = None  # last operator for repeat equals
-        self.last_operand = None  # last operand for repeat equals
+        self._preview_job = None  # 等待执行的预览 after 任务
+
+        # 输入内容以控制器中的缓冲为准；输入框在每轮事件处理结束后（after_idle）同步一次，
+        # 连续按键或整段粘贴不会逐字符读写 Tk。修改缓冲前先读回输入框（见 _current_text）
+        self._buffer = "0"
+        self._cursor = None  # 同步后插入光标的位置，None 表示末尾
+        self._sync_job = None
+
+        # "=" 的计算放在后台进程中执行，结果通过 after 轮询取回；
+        # background=False 时在当前线程同步计算（无界面环境使用）
+        self.background = background
+        self._pool = None
+        self._pending = None  # (任务编号, AsyncResult, 表达式, 重复运算的起点, 重复次数)
+        self._job_id = 0
+        self._equals_started = 0.0  # 本次 "=" 的开始时间（用于指标）
 
+        # 历史浏览：按输入前缀匹配到的记录（从新到旧）与当前位置，-1 表示原始输入
+        self._history_matches = None
+        self._history_cursor = -1
+        self._history_origin = ""
+
+        # 计时钩子：mode_switch_hook(模式, 耗时秒数)，用于观察模式切换延迟
+        self.mode_switch_hook = None
 
     def handle_mode_change(self, new_mode_name):
         """处理模式切换"""
-        self.view.update_display("0", "")
-        self.is_result_displayed = False
-        self.last_expression = None
-        self.last_operator = None
-        self.last_operand = None
+        started = time.perf_counter()
+        self._switch_mode(new_mode_name)
+        if self.mode_switch_hook is not None:
+            # 等待界面完成重排，计入真实的切换耗时
+            self.view.update_idletasks()
+            self.mode_switch_hook(self.mode, time.perf_counter() - started)
+
+    def _switch_mode(self, new_mode_name):
+        self._cancel_preview()
+        self._history_matches = None
+        self._cancel_evaluation()
+        self._show("0", "")
+        self.reset_state()
         
         if new_mode_name == "标准模式":
             self.mode = "Standard"
@@ -44,126 +83,86 @@ class CalculatorController:
         if self.mode != "Programmer" or self.current_base == new_base:
             return
             
-        current_expr = self.view.get_display_text()
-        try:
-            new_expr = self._convert_expression_base(current_expr, self.current_base, new_base)
+        self._cancel_evaluation()
+        if self.is_result_displayed and self.result_value is not None:
+            # 显示的结果可能只是超大整数的预览，按精确数值重新格式化
             self.current_base = new_base
-            self.view.update_display(new_expr, "")
-            self.view.update_base_selection(self.current_base)
-            self.view.update_button_states(self.current_base)
-        except Exception:
-            # 如果转换失败，不切换进制或显示错误
-            pass
+            new_expr, sub_text = self._format_calculation(self.result_value)
+        else:
+            try:
+                new_expr = self._convert_expression_base(self._current_text(), self.current_base, new_base)
+            except Exception:
+                # 如果转换失败，不切换进制或显示错误
+                return
+            self.current_base = new_base
+            sub_text = ""
+        self._show(new_expr, sub_text)
+        self.view.update_base_selection(self.current_base)
+        self.view.update_button_states(self.current_base)
+
+    def handle_word_size_change(self, word_name, signed):
+        """处理字长/有无符号切换：word_name 为 BYTE/WORD/DWORD/QWORD，其他值表示不限位宽"""
+        word_size = WORD_SIZES.get(word_name)
+        if self.mode != "Programmer" or (word_size, signed) == (self.word_size, self.signed):
+            return
+
+        self._cancel_evaluation()
+        # 已显示的结果先按旧字长取值，再截断到新字长（扩展时保留符号）；输入中的表达式只刷新预览
+        value = None
+        if self.is_result_displayed:
+            # 显示文本可能只是超大整数的预览，优先使用精确数值
+            value = self.result_value
+            if value is None:
+                try:
+                    value = self._evaluate(self._current_text())
+                except Exception:
+                    pass
+        self.word_size = word_size
+        self.signed = signed
+        if value is not None:
+            self.result_value = self._wrap(value)
+            self._show(*self._format_calculation(self.result_value))
+        self._schedule_preview()
 
     def handle_button_click(self, char):
-        """处理所有按钮点击（按 '=' 时读取输入框内容计算）"""
-        # 读取当前输入框内容（支持直接键盘输入或按钮输入）
-        current = self.view.get_display_text()
+        """处理所有按钮点击（按 '=' 时计算当前输入）"""
+        current = self._current_text()
         # 错误状态重置
         if "Error" in current or "哈哈哈" in current:
-            self.view.update_display("0", "")
+            current = "0"
+            self._show(current, "")
             if char in ["=", "CLEAR", "Backspace"]:
                 return
 
+        if char in ('CLEAR', '='):
+            self._cancel_preview()
+        self._history_matches = None
+
+        if char != '=':
+            # 任何编辑（包括 CLEAR）都丢弃进行中的计算，仍在执行时终止后台进程
+            self._cancel_evaluation()
+
         if char == 'CLEAR':
-            self.view.update_display("0", "")
-            self.is_result_displayed = False
-            self.last_expression = None
-            self.last_operator = None
-            self.last_operand = None
+            self._show("0", "")
+            self.reset_state()
             return
 
         if char == '=':
-            expr = self.view.get_display_text()
-            if not expr or expr == "0":
-                return
-            
-            # 时间模式
-            if self.mode == "Time":
-                try:
-                    converted_value, converted_unit, original_value, original_unit = self.model.convert_time(expr)
-                    result_str, sub_label_str = formatter.format_time_conversion(
-                        converted_value,
-                        converted_unit,
-                        original_value,
-                        original_unit,
-                    )
-                except (ValueError, IndexError):
-                    result_str, sub_label_str = formatter.format_error("time")
-
-                self.view.update_display(result_str, sub_label_str)
-                self.is_result_displayed = False
-                self.last_expression = None
+            expr = current
+            if not expr or expr == "0" or self._pending is not None:
                 return
             
             # 233 彩蛋
-            if expr == '233':
-                self.view.update_display("哈哈哈", "")
-                return
-            
-            # 处理排序逻辑（检测是否包含逗号）
-            if ',' in expr:
-                try:
-                    numbers = self.model.sort_numbers(expr)
-                    result_str, sub_label_str = formatter.format_sorted_numbers(numbers)
-                except Exception:
-                    result_str, sub_label_str = formatter.format_error("sort")
-
-                self.view.update_display(result_str, sub_label_str)
-                self.is_result_displayed = False
-                self.last_expression = None
+            if expr == '233' and self.mode != "Time":
+                self._show("哈哈哈", "")
                 return
             
             # 检查是否是重复按"="（已显示结果的情况下再按"="）
-            if self.is_result_displayed and self.last_expression:
-                # 重复运算：用上一次的结果和操作数进行相同的运算
-                if self.last_operator and self.last_operand is not None:
-                    try:
-                        if self.mode == "Programmer":
-                            val_dec = int(current, self._base_to_int(self.current_base))
-                            eval_expr = f"{val_dec}{self.last_operator}{self.last_operand}"
-                        else:
-                            eval_expr = f"{current}{self.last_operator}{self.last_operand}"
-                        
-                        result = self.model.evaluate(eval_expr, self.mode)
-                        
-                        if self.mode == "Programmer":
-                            result_str = self._to_base_string(int(result), self.current_base)
-                            sub_label_str = ""
-                        else:
-                            result_str, sub_label_str = formatter.format_result(result)
-                        
-                        self.view.update_display(result_str, sub_label_str)
-                        return
-                    except Exception:
-                        pass
-            
-            # 调用 Model 进行计算
-            try:
-                eval_expr = expr
-                if self.mode == "Programmer":
-                    eval_expr = self._convert_expression_to_dec(expr)
-                
-                result = self.model.evaluate(eval_expr, self.mode)
-                
-                if self.mode == "Programmer":
-                    result_str = self._to_base_string(int(result), self.current_base)
-                    sub_label_str = ""
-                else:
-                    result_str, sub_label_str = formatter.format_result(result)
-            except ZeroDivisionError:
-                result_str, sub_label_str = formatter.format_error("div0")
-            except Exception:
-                result_str, sub_label_str = formatter.format_error("generic")
+            repeat_from = None
+            if self.mode != "Time" and ',' not in expr and self.is_result_displayed and self.last_expression:
+                repeat_from = current
 
-            self.view.update_display(result_str, sub_label_str)
-            
-            # 提取表达式中的最后一个运算符和操作数
-            self._extract_last_operation(expr)
-            
-            # 标记已显示结果
-            self.is_result_displayed = True
-            self.last_expression = expr
+            self._start_evaluation(expr, repeat_from)
             return
 
         if char == 'Backspace':
@@ -171,8 +170,9 @@ class CalculatorController:
             display_text = new_text if new_text else "0"
 
             # 退格时更新显示
-            self.view.update_display(display_text, "")
+            self._show(display_text, "")
             self.is_result_displayed = False
+            self._schedule_preview()
             return
             
         op_aliases = {"AND": "&", "OR": "|", "XOR": "^", "NOT": "~", "\u00d7": "*", "\u00f7": "/", "\u2212": "-"}
@@ -181,108 +181,250 @@ class CalculatorController:
 
         if char == "+/-":
             new_text = self._toggle_sign(current)
-            self.view.update_display(new_text, "")
+            self._show(new_text, "")
             self.is_result_displayed = False
+            self._schedule_preview()
             return
 
 
-        # 下面是普通字符（数字/运算符/字母）追加到输入框的逻辑
-        # 1. 运算符重复检查
-        if char in "+-*/%&|^":
-            if not current or current == "0":
-                return
-            if current[-1] in "+-*/%&|^":
-                return
-
-
-        # 2. 时间模式禁用特定字符
+        # 时间模式禁用特定字符
         if self.mode == "Time" and char in ["+-*/%"]:
             return
 
-        # 3. 将字符追加到输入框（如果当前为 "0" 则替换）
-        if current == "0":
-            new_text = str(char)
-        else:
-            new_text = current + str(char)
+        # 普通字符（数字/运算符/字母）追加到输入（运算符重复检查、替换 "0" 见 _append_input）
+        self._ingest(current, str(char))
+
+    def handle_paste(self, text, start=None, end=None):
+        """整段粘贴：替换输入中 [start, end) 的内容（None 表示追加到末尾），
+        按与逐个按键相同的规则一次性校验，输入框只同步一次"""
+        current = self._current_text()
+        if current == "0" or "Error" in current or "哈哈哈" in current:
+            current, start, end = "0", None, None
+        self._history_matches = None
+        self._cancel_evaluation()
+        if start is None:
+            start = end = len(current)
+        self._ingest(current[:start], text.strip(), current[end:])
+
+    def _ingest(self, head, text, tail=""):
+        new_head = self._append_input(head, text, tail)
+        if new_head is None:
+            return  # 全部被拒绝（如重复的运算符）
 
         # 重置结果显示标记（用户开始输入新内容）
         self.is_result_displayed = False
 
-        # 更新输入显示
-        self.view.update_display(new_text, None)
-
-    def _convert_expression_base(self, expr, from_base, to_base):
-        """转换表达式中所有数字的进制"""
-        pattern_map = {
-            "HEX": r'[0-9A-Fa-f]+',
-            "DEC": r'[0-9]+',
-            "OCT": r'[0-7]+',
-            "BIN": r'[0-1]+'
-        }
-        pattern = pattern_map.get(from_base, r'[0-9]+')
-        
-        def replace_func(match):
-            val_str = match.group(0)
-            val = int(val_str, self._base_to_int(from_base))
-            return self._to_base_string(val, to_base)
-            
-        return re.sub(pattern, replace_func, expr)
+        # 更新输入显示，光标停在插入内容之后
+        self._show(new_head + tail, cursor=len(new_head) if tail else None)
+        self._schedule_preview()
 
-    def _convert_expression_to_dec(self, expr):
-        """将表达式中所有数字转换为 10 进制"""
-        return self._convert_expression_base(expr, self.current_base, "DEC")
+    def handle_repeat(self, count):
+        """把上一次的运算重复 count 次（相当于连按 count 次 "="）"""
+        if (self.mode == "Time" or count < 1 or self._pending is not None
+                or not self.is_result_displayed or not self.last_operator):
+            return
+        self._cancel_preview()
+        self._history_matches = None
+        self._start_evaluation(self.last_expression, self._buffer, count)
 
-    def _base_to_int(self, base_name):
-        return {"HEX": 16, "DEC": 10, "OCT": 8, "BIN": 2}.get(base_name, 10)
+    def handle_text_edited(self):
+        """输入框被键盘直接编辑后读回缓冲并刷新预览"""
+        self._current_text()
+        self._history_matches = None
+        self._cancel_evaluation()
+        self.is_result_displayed = False
+        self._schedule_preview()
 
-    def _to_base_string(self, val, base_name):
-        """将数字转换为对应进制的字符串"""
-        if val < 0:
-            return "-" + self._to_base_string(abs(val), base_name)
-        
-        if base_name == "HEX":
-            return hex(val)[2:].upper()
-        elif base_name == "DEC":
-            return str(val)
-        elif base_name == "OCT":
-            return oct(val)[2:]
-        elif base_name == "BIN":
-            return bin(val)[2:]
-        return str(val)
-
-    def _toggle_sign(self, text: str) -> str:
-        """切换当前输入的末尾数值符号。"""
-        # 程序员模式支持 A-F
-        pattern = r"([0-9A-Fa-f]+)$" if self.mode == "Programmer" else r"(\d+(?:\.\d+)?)$"
-        match = re.search(pattern, text)
-        if not match:
-            return text
-
-        start = match.start()
-        if start > 0 and text[start - 1] == "-":
-            prev = text[start - 2] if start - 2 >= 0 else ""
-            if start == 1 or prev.isspace() or prev in "+-*/%&|^<>()":
-                return text[:start - 1] + text[start:]
-
-        return text[:start] + "-" + text[start:]
-
-    def _extract_last_operation(self, expression: str):
-        """从表达式中提取最后一个运算符和操作数"""
-        # 模式：(数字或字母) (运算符) (数字或字母)
-        pattern = r'([0-9A-Fa-f.]+)\s*([+\-*/%&|^])\s*([0-9A-Fa-f.]+)$'
-        match = re.search(pattern, expression)
-        
-        if match:
-            last_op_str = match.group(3)
-            self.last_operator = match.group(2)
-            try:
-                if self.mode == "Programmer":
-                    self.last_operand = int(last_op_str, self._base_to_int(self.current_base))
-                else:
-                    self.last_operand = float(last_op_str) if '.' in last_op_str else int(last_op_str)
-            except Exception:
-                self.last_operand = None
-                self.last_operator = None
+    def handle_history_step(self, step):
+        """上下键浏览历史：step=-1 取更早的记录，+1 取更新的记录。
+
+        首次按键时以当前输入为前缀在历史索引中查找同模式的记录，之后在匹配结果中移动；
+        回到起点时恢复原始输入。任何编辑都会结束浏览。
+        """
+        if self.history is None or self._pending is not None:
+            return
+        if self._history_matches is None:
+            current = self._current_text()
+            prefix = "" if self.is_result_displayed or current == "0" or "Error" in current else current
+            matches = []
+            for n in self.history.search_prefix(prefix, _HISTORY_RECALL_LIMIT):
+                entry = self.history.get(n)
+                if entry["mode"] == self.mode:
+                    matches.append(entry)
+            self._history_matches = matches
+            self._history_cursor = -1
+            self._history_origin = current
+
+        cursor = self._history_cursor - step
+        if not -1 <= cursor < len(self._history_matches):
+            return
+        self._history_cursor = cursor
+        if cursor == -1:
+            text = self._history_origin
         else:
-            self.last_operand = None
-            self.last_operator = None
+            entry = self._history_matches[cursor]
+            text = entry["expression"]
+            if self.mode == "Programmer" and entry["base"] != self.current_base:
+                try:
+                    text = self._convert_expression_base(text, entry["base"], self.current_base)
+                except ValueError:
+                    pass  # 含小数等无法换算的记录按原文显示
+
+        self._cancel_evaluation()
+        self.is_result_displayed = False
+        self._show(text, "")
+        self._schedule_preview()
+
+    def handle_copy_result(self):
+        """复制当前显示：若为计算结果则复制完整文本（超大整数此时才完整展开）"""
+        self.view.set_clipboard("".join(self._result_chunks()))
+
+    def handle_export_result(self):
+        """把当前结果的完整文本分块写入用户选择的文件"""
+        path = self.view.ask_export_path()
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(self._result_chunks())
+        except OSError:
+            self.view.update_sub_label(formatter.format_error("generic")[0])
+
+    def _result_chunks(self):
+        chunks = self.iter_result_text() if self.is_result_displayed else None
+        if chunks is None:
+            return iter((self._current_text(),))
+        return chunks
+
+    def _current_text(self):
+        """读回输入框：中键粘贴、拖放等不经过按键事件的编辑也以输入框为准，不会被下一次按钮覆盖"""
+        if self._sync_job is None:
+            # 有待同步的内容时输入框尚未被直接编辑过（按键前会先 flush_display），缓冲仍是最新的
+            text = self.view.get_display_text()
+            if text != self._buffer:
+                self._buffer = text
+                self.is_result_displayed = False
+                self._history_matches = None
+        return self._buffer
+
+    def _show(self, text, sub_text=None, cursor=None):
+        """更新输入缓冲（副标签立即更新），输入框在本轮事件处理结束后同步一次"""
+        self._buffer = text
+        self._cursor = cursor
+        if sub_text is not None:
+            self.view.update_sub_label(sub_text)
+        if self._sync_job is None:
+            self._sync_job = self.view.after_idle(self._sync_display)
+
+    def _sync_display(self):
+        self._sync_job = None
+        with METRICS.time("display"):
+            self.view.update_display(self._buffer, cursor=self._cursor)
+
+    def flush_display(self):
+        """立即把缓冲写入输入框；键盘直接编辑前调用，保证编辑作用在最新内容上"""
+        if self._sync_job is not None:
+            self.view.after_cancel(self._sync_job)
+            self._sync_display()
+
+    def _schedule_preview(self):
+        """防抖：连续输入时只在停顿后计算一次预览"""
+        self._cancel_preview()
+        self._preview_job = self.view.after(_PREVIEW_DELAY_MS, self._update_preview)
+
+    def _cancel_preview(self):
+        if self._preview_job is not None:
+            self.view.after_cancel(self._preview_job)
+            self._preview_job = None
+
+    def _update_preview(self):
+        self._preview_job = None
+        self.view.update_sub_label(self.preview(self._current_text()))
+
+    def _start_evaluation(self, expr, repeat_from, count=1):
+        """提交 "=" 计算：后台进程执行，完成后在 Tk 主线程更新界面"""
+        self._job_id += 1
+        METRICS.count("equals")
+        if METRICS.enabled:
+            self._equals_started = time.perf_counter()
+        if not self.background or self.uses_workspace(expr):
+            # 变量与公式保存在界面进程中，涉及它们的计算在当前线程完成
+            self._finish_evaluation(expr, repeat_from, count, self.run_equals(expr, repeat_from, count))
+            return
+
+        if self._pool is None:
+            self._pool = multiprocessing.get_context("spawn").Pool(processes=1)
+        state = (self.mode, self.current_base, self.word_size, self.signed,
+                 self.last_operator, self.last_operand, self.result_value)
+        async_result = self._pool.apply_async(
+            run_equals_in_worker, (state, expr, repeat_from, count, METRICS.enabled)
+        )
+        self._pending = (self._job_id, async_result, expr, repeat_from, count)
+        self.view.after(_FIRST_POLL_MS, self._poll_evaluation, self._job_id, _FIRST_POLL_MS)
+
+    def _poll_evaluation(self, job_id, delay):
+        if self._pending is None or self._pending[0] != job_id:
+            return  # 已取消或已过期
+        _, async_result, expr, repeat_from, count = self._pending
+        if not async_result.ready():
+            # 已等待的时间约为 2 * delay
+            if delay < _PENDING_LABEL_MS <= 2 * delay:
+                self.view.update_sub_label(formatter.format_pending())
+            delay = min(2 * delay, _POLL_MS)
+            self.view.after(delay, self._poll_evaluation, job_id, delay)
+            return
+
+        self._pending = None
+        try:
+            outcome, self.result_value, worker_metrics = async_result.get()
+        except Exception:
+            outcome = (*self._error("generic"), False)
+            self.result_value = None
+            worker_metrics = None
+        if worker_metrics is not None:
+            METRICS.merge(worker_metrics)
+        self._finish_evaluation(expr, repeat_from, count, outcome)
+
+    def _finish_evaluation(self, expr, repeat_from, count, outcome):
+        result_str, sub_label_str, repeated = outcome
+        self._show(result_str, sub_label_str)
+        if METRICS.enabled:
+            METRICS.observe("equals", time.perf_counter() - self._equals_started)
+        try:
+            self.record_history(self.repeat_expression(repeat_from, count) if repeated else expr, result_str)
+        except OSError:
+            # 历史文件不可写时不影响计算本身
+            self.history = None
+        if repeated:
+            return
+        if self.mode == "Time" or ',' in expr or self.is_aggregate(expr):
+            self.is_result_displayed = False
+            self.last_expression = None
+            return
+
+        # 提取表达式中的最后一个运算符和操作数
+        self._extract_last_operation(expr)
+
+        # 标记已显示结果
+        self.is_result_displayed = True
+        self.last_expression = expr
+
+    def _cancel_evaluation(self):
+        """丢弃进行中的计算；若仍在执行则终止后台进程"""
+        if self._pending is None:
+            return
+        async_result = self._pending[1]
+        self._pending = None
+        self._job_id += 1
+        if not async_result.ready():
+            self._pool.terminate()
+            self._pool = None
+
+    def shutdown(self):
+        """关闭窗口时调用：丢弃进行中的计算并关闭后台进程池"""
+        self._cancel_preview()
+        self._cancel_evaluation()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,504 @@
+import bisect
+import operator
+import re
+from typing import Optional
+import baseconv
+import calc_parser
+import formatter
+from metrics import METRICS
+from model import CalculatorModel, EvaluationLimitError, wrap_int
+from workspace import Workspace
+
+# 输入超过该长度时排序改走分段/外部归并路径
+_STREAM_SORT_THRESHOLD = 1 << 20
+
+# 实时预览：优先级低于 +/- 的运算符出现在顶层时无法按项增量计算
+_LOW_PRECEDENCE_CHARS = "&|^<>"
+_ADDITIVE_OPS = {"+": operator.add, "-": operator.sub}
+# 实时预览在界面线程中计算，使用比 "=" 小得多的计算预算，超出时不显示预览
+_PREVIEW_MAX_BITS = 1 << 16
+_PREVIEW_MAX_COST = 1 << 20
+
+# 标准模式下的命名变量：赋值语句，以及不跟在数字后面的标识符（排除 1e5 这类科学计数法）
+_ASSIGNMENT_PATTERN = re.compile(r"^\s*([A-Za-z_]\w*)\s*=(?!=)\s*(.+)$", re.S)
+_NAME_PATTERN = re.compile(r"(?<![\w.])[A-Za-z_]")
+
+# 按键/粘贴输入：运算符不能紧跟在运算符之后，连续的运算符只保留第一个
+_OPERATOR_CHARS = "+-*/%&|^"
+_OPERATOR_RUN_PATTERN = re.compile(r"([-+*/%&|^])[-+*/%&|^]+")
+_INPUT_ALIASES = str.maketrans({"\u00d7": "*", "\u00f7": "/", "\u2212": "-"})
+
+# 逗号列表的统计函数：sum(…)、mean(…)、median(…)、p90(…)、top5(…)、bottom3(…) 等
+_AGGREGATE_PATTERN = re.compile(
+    r"^\s*(sum|mean|count|min|max|median|p|top|bottom)(\d+(?:\.\d+)?)?\s*\((.*)\)\s*$", re.S
+)
+_AGGREGATE_FUNCS = {"p": "percentile"}
+_AGGREGATE_ARG_FUNCS = frozenset({"p", "top", "bottom"})
+
+
+class CalculatorCore:
+    """计算器的非界面逻辑：模式/进制状态、表达式计算、进制转换与重复 "=" 状态。
+
+    只依赖标准库，可在无界面环境（批处理、脚本）中直接使用。
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+        # 应用状态
+        self.mode = "Standard" # "Standard" or "Programmer" or "Time"
+        self.current_base = "DEC" # "HEX", "DEC", "OCT", "BIN"
+        self.word_size = None  # 程序员模式的字长（位数），None 表示不限位宽
+        self.signed = True  # 定长整数按有符号（补码）解释
+        self.last_expression = None  # 存储上一次的表达式
+        self.is_result_displayed = False  # showing result flag
+        self.last_operator = None  # last operator for repeat equals
+        self.last_operand = None  # last operand for repeat equals
+        self.result_value = None  # 最近一次 "=" 的精确数值（显示可能只是超大整数的预览）
+        self.workspace = Workspace(model)  # 标准模式下的命名变量与公式
+        self.history = None  # 可选的 HistoryStore，记录每次计算
+
+        # 实时预览的增量状态：上次预览的文本，以及顶层 +/- 分隔位置和对应的前缀值
+        self._preview_key = None
+        self._preview_text = ""
+        self._preview_splits = []
+        self._preview_values = []
+
+    def reset_state(self):
+        """清除结果显示标记与重复运算状态"""
+        self.is_result_displayed = False
+        self.last_expression = None
+        self.last_operator = None
+        self.last_operand = None
+
+    def evaluate_expression(self, expr):
+        """按当前模式计算一行表达式，返回 (主显示文本, 副标签文本)，不读写界面"""
+        if self.mode == "Time":
+            return self._evaluate_time(expr)
+        aggregate = _AGGREGATE_PATTERN.match(expr)
+        if aggregate is not None:
+            return self._evaluate_aggregate(*aggregate.groups())
+        if ',' in expr:
+            return self._evaluate_sort(expr)
+        return self._evaluate_calculation(expr)
+
+    def preview(self, text):
+        """计算输入中表达式的实时预览文本；无法计算时返回空字符串。
+
+        表达式按顶层的二元 +/- 切分为若干项，每个已完成项结束处记录前缀值。
+        文本只在末尾变化时（追加或退格）复用未变化部分的前缀值，只重新
+        计算变化的后缀，因此每次按键的开销与表达式总长度基本无关。
+        顶层含位运算/移位时退回整体计算（结果仍由模型缓存）。
+        计算使用收紧的预算（_PREVIEW_MAX_BITS / _PREVIEW_MAX_COST），代价大的表达式不显示预览。
+        """
+        if self.mode == "Time" or not text or "," in text:
+            return ""
+        with self.model.limited_budget(_PREVIEW_MAX_BITS, _PREVIEW_MAX_COST):
+            return self._preview(text)
+
+    def _preview(self, text):
+        if "=" in text:
+            assignment = _ASSIGNMENT_PATTERN.match(text) if self.mode == "Standard" else None
+            return self._preview_whole(assignment.group(2)) if assignment else ""
+
+        key = (self.mode, self.current_base, self.word_size, self.signed, self.workspace.version)
+        previous = self._preview_text
+        if key != self._preview_key:
+            common = 0
+        elif text.startswith(previous):
+            common = len(previous)
+        elif previous.startswith(text):
+            common = len(text)
+        else:
+            common = 0
+        self._preview_key = key
+        self._preview_text = text
+
+        # 只保留分隔符仍位于未变化前缀内的检查点
+        keep = bisect.bisect_left(self._preview_splits, common)
+        del self._preview_splits[keep:]
+        del self._preview_values[keep:]
+
+        if self._preview_splits:
+            start = self._preview_splits[-1] + 1
+            value = self._preview_values[-1]
+            op = _ADDITIVE_OPS[text[start - 1]]
+        else:
+            start = 0
+            value = None
+            op = None
+
+        try:
+            depth = 0
+            term_start = start
+            for i in range(start, len(text)):
+                ch = text[i]
+                if ch == "(":
+                    depth += 1
+                elif ch == ")":
+                    depth -= 1
+                elif depth == 0 and ch in _LOW_PRECEDENCE_CHARS:
+                    return self._preview_whole(text)
+                elif depth == 0 and ch in _ADDITIVE_OPS and self._is_binary_operator(text, i, term_start):
+                    term = self._evaluate_term(text[term_start:i])
+                    value = term if op is None else self._wrap(op(value, term))
+                    op = _ADDITIVE_OPS[ch]
+                    self._preview_splits.append(i)
+                    self._preview_values.append(value)
+                    term_start = i + 1
+
+            last_term = text[term_start:].strip()
+            if last_term:
+                term = self._evaluate_term(last_term)
+                value = term if op is None else self._wrap(op(value, term))
+            if value is None:
+                return ""
+            return formatter.format_preview(self._format_calculation(value)[0])
+        except Exception:
+            return ""
+
+    def _preview_whole(self, text):
+        """整体计算预览（不可增量时）"""
+        try:
+            value = self._evaluate_term(text)
+        except Exception:
+            return ""
+        return formatter.format_preview(self._format_calculation(value)[0])
+
+    def _is_binary_operator(self, text, index, term_start):
+        """判断 text[index] 处的 +/- 是否为二元运算符（而非正负号）"""
+        j = index - 1
+        while j >= term_start and text[j].isspace():
+            j -= 1
+        if j < term_start:
+            return False
+        prev = text[j]
+        # 标准模式下的科学计数法，如 1e-5
+        if self.mode != "Programmer" and prev in "eE" and j > term_start and text[j - 1].isdigit():
+            return False
+        return prev.isalnum() or prev in ".)"
+
+    def _evaluate_term(self, term):
+        """计算预览中的单个加减项"""
+        return self._evaluate(term)
+
+    def _evaluate(self, expr):
+        """调用模型计算，程序员模式下按当前进制与字长，标准模式下的变量引用交给 workspace"""
+        if self.mode == "Programmer":
+            return self.model.evaluate(
+                expr, self.mode, self.word_size, self.signed, self._base_to_int(self.current_base)
+            )
+        if self.uses_workspace(expr):
+            return self.workspace.evaluate(expr)
+        return self.model.evaluate(expr, self.mode)
+
+    def uses_workspace(self, expr):
+        """表达式是否为标准模式下的赋值或引用了命名变量"""
+        return (self.mode == "Standard" and _NAME_PATTERN.search(expr) is not None
+                and not self.is_aggregate(expr))
+
+    def is_aggregate(self, expr):
+        """表达式是否为逗号列表的统计函数调用（时间模式下不识别）"""
+        return self.mode != "Time" and _AGGREGATE_PATTERN.match(expr) is not None
+
+    def _wrap(self, value):
+        """预览中在核心里合并的加减结果同样截断到当前字长"""
+        if self.mode == "Programmer" and self.word_size:
+            return wrap_int(int(value), self.word_size, self.signed)
+        return value
+
+    def run_equals(self, expr, repeat_from=None, count=1):
+        """执行一次 "=" 的计算部分，返回 (主显示文本, 副标签文本, 是否为重复运算)。
+
+        repeat_from 为当前显示的上一次结果时，先尝试把上一次的运算重复 count 次；
+        明确要求重复多次（count > 1）却无法重复时显示错误，不退回未重复的结果。
+        """
+        previous_value, self.result_value = self.result_value, None
+        if repeat_from is not None:
+            repeated = self.repeat_last_operation(repeat_from, count, previous_value)
+            if repeated is not None:
+                return (*repeated, True)
+            if count > 1:
+                return (*self._error("generic"), False)
+        return (*self.evaluate_expression(expr), False)
+
+    def repeat_expression(self, current, count=1):
+        """重复 "=" 时实际计算的表达式（按当前进制书写），用于记录历史；多次重复时附上次数"""
+        operand = self.last_operand
+        if self.mode == "Programmer" and isinstance(operand, int):
+            operand = self._to_base_string(operand, self.current_base)
+        text = f"{current}{self.last_operator}{operand}"
+        return text if count == 1 else f"{text} ×{count}"
+
+    def record_history(self, expr, result_str):
+        """把一次计算追加到历史（未启用历史时不做任何事）"""
+        if self.history is not None:
+            self.history.append(expr, self.mode, self.current_base, result_str)
+
+    def rerun_history(self, n):
+        """切换到第 n 条历史记录当时的模式与进制并重新计算，返回 (主显示文本, 副标签文本)；
+        之后可用 iter_result_text 按该进制取完整结果"""
+        entry = self.history.get(n)
+        self.mode, self.current_base = entry["mode"], entry["base"]
+        self.result_value = None
+        return self.evaluate_expression(entry["expression"])
+
+    def repeat_last_operation(self, current, count=1, value=None):
+        """把上一次的运算符和操作数作用于当前结果 count 次，失败或无可重复运算时返回 None。
+
+        value 为当前结果的精确数值（没有时解析显示文本）；运算直接交给
+        model.iterate，不重新拼接和解析表达式，有闭式解时与 count 无关。
+        """
+        if not self.last_operator or self.last_operand is None:
+            return None
+        try:
+            if value is None:
+                value = self._parse_display_value(current)
+            result = self.model.iterate(
+                value, self.last_operator, self.last_operand, count, self.mode,
+                self.word_size, self.signed,
+            )
+            formatted = self._format_calculation(result)
+        except ZeroDivisionError:
+            return self._error("div0")
+        except (EvaluationLimitError, OverflowError):
+            return self._error("limit")
+        except Exception:
+            return None
+        self.result_value = result
+        return formatted
+
+    def _parse_display_value(self, text):
+        """把显示的结果文本解析为数值"""
+        if self.mode == "Programmer":
+            return baseconv.string_to_int(text, self._base_to_int(self.current_base))
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+    def _evaluate_time(self, expr):
+        """时间换算；逗号或换行分隔的列表整体换算"""
+        if ',' in expr or '\n' in expr:
+            pieces, sub_label_str = self.stream_time(expr)
+            return "".join(pieces), sub_label_str
+        try:
+            converted_value, converted_unit, original_value, original_unit = self.model.convert_time(expr)
+            return formatter.format_time_conversion(
+                converted_value,
+                converted_unit,
+                original_value,
+                original_unit,
+            )
+        except (ValueError, IndexError):
+            return self._error("time")
+
+    def stream_time(self, expr):
+        """批量时间换算：返回 (分块产出文本的迭代器, 副标签文本)"""
+        try:
+            converted, _, units = self.model.convert_times(expr)
+        except ValueError:
+            result_str, sub_label_str = self._error("time")
+            return iter((result_str,)), sub_label_str
+        return formatter.format_time_conversions(converted, units)
+
+    def stream_sort(self, source):
+        """大数据量排序：返回 (分块产出文本的迭代器, 副标签文本)，source 可为字符串或文本块迭代器"""
+        try:
+            numbers = self.model.iter_sorted_numbers(source)
+        except Exception:
+            result_str, sub_label_str = self._error("sort")
+            return iter((result_str,)), sub_label_str
+        return formatter.format_sorted_numbers_stream(numbers)
+
+    def _evaluate_sort(self, expr):
+        """逗号分隔的数值排序"""
+        if len(expr) >= _STREAM_SORT_THRESHOLD:
+            pieces, sub_label_str = self.stream_sort(expr)
+            return "".join(pieces), sub_label_str
+        try:
+            numbers = self.model.sort_numbers(expr)
+            return formatter.format_sorted_numbers(numbers)
+        except Exception:
+            return self._error("sort")
+
+    def _evaluate_aggregate(self, name, arg, body):
+        """逗号列表的统计：单遍计算，不排序整个列表、也不拼接排序后的文本"""
+        try:
+            if (arg is None) == (name in _AGGREGATE_ARG_FUNCS):
+                raise ValueError(f"{name} 的参数无效")
+            func = _AGGREGATE_FUNCS.get(name, name)
+            param = None if arg is None else (float(arg) if name == "p" else int(arg))
+            with METRICS.time("aggregate"):
+                result = self.model.aggregate_numbers(body, func, param)
+            with METRICS.time("format"):
+                formatted = formatter.format_aggregate(func, param, result)
+        except Exception:
+            return self._error("stats")
+        if self.mode == "Standard" and not isinstance(result, list):
+            self.result_value = result
+        return formatted
+
+    def _evaluate_calculation(self, expr):
+        """普通算术/位运算表达式"""
+        try:
+            assignment = _ASSIGNMENT_PATTERN.match(expr) if self.mode == "Standard" else None
+            if assignment is not None:
+                return self._define_variable(*assignment.groups())
+
+            result = self._evaluate(expr)
+            with METRICS.time("format"):
+                formatted = self._format_calculation(result)
+            self.result_value = result
+            return formatted
+        except ZeroDivisionError:
+            return self._error("div0")
+        except EvaluationLimitError:
+            return self._error("limit")
+        except Exception:
+            return self._error("generic")
+
+    def _define_variable(self, name, expression):
+        """name = expression：定义或修改变量，只重新计算依赖它的公式"""
+        result = self.workspace.define(name, expression.strip())
+        text, _ = self._format_calculation(result)
+        self.result_value = result
+        return text, f"{name} ({self.workspace.recomputed} updated)"
+
+    def _error(self, kind):
+        """记录错误类型并返回对应的显示文本"""
+        METRICS.error(kind)
+        return formatter.format_error(kind)
+
+    def _format_calculation(self, result):
+        """按当前模式格式化计算结果（超大整数在任何进制下都只生成预览，完整结果见 iter_result_text）"""
+        if self.mode == "Programmer":
+            value = int(result)
+            base = self._base_to_int(self.current_base)
+            if formatter.is_large_int(value, base):
+                return formatter.format_large_int(value, base)
+            return self._to_base_string(value, self.current_base), ""
+        return formatter.format_result(result)
+
+    def iter_result_text(self):
+        """按需分块产出最近一次结果的完整文本（复制/导出用）；没有数值结果时返回 None"""
+        value = self.result_value
+        if value is None:
+            return None
+        if self.mode == "Programmer":
+            value = int(value)
+            if self.word_size and self.current_base != "DEC":
+                value &= (1 << self.word_size) - 1
+            return formatter.iter_full_result(value, self._base_to_int(self.current_base))
+        if isinstance(value, int):
+            return formatter.iter_full_result(value)
+        return iter((formatter.format_result(value)[0],))
+
+    def _convert_expression_base(self, expr, from_base, to_base):
+        """转换表达式中所有数字的进制，运算符与空白保持原样；含小数等无法转换的数字时抛出 ValueError"""
+        pieces = []
+        last = 0
+        with METRICS.time("convert_base"):
+            for kind, value, start, end in calc_parser.tokenize(expr, self._base_to_int(from_base)):
+                if kind != calc_parser.NUMBER:
+                    continue
+                if type(value) is not int:
+                    raise ValueError(f"无法转换进制: {expr[start:end]}")
+                pieces.append(expr[last:start])
+                pieces.append(self._to_base_string(value, to_base))
+                last = end
+            pieces.append(expr[last:])
+        return "".join(pieces)
+
+    def _base_to_int(self, base_name):
+        return {"HEX": 16, "DEC": 10, "OCT": 8, "BIN": 2}.get(base_name, 10)
+
+    def _to_base_string(self, val, base_name):
+        """将数字转换为对应进制的字符串；定长整数在非十进制下显示补码"""
+        if self.word_size and base_name != "DEC":
+            val &= (1 << self.word_size) - 1
+        return baseconv.int_to_string(val, self._base_to_int(base_name))
+
+    def _toggle_sign(self, text: str) -> str:
+        """切换当前输入的末尾数值符号。"""
+        # 程序员模式支持 A-F
+        pattern = r"([0-9A-Fa-f]+)$" if self.mode == "Programmer" else r"(\d+(?:\.\d+)?)$"
+        match = re.search(pattern, text)
+        if not match:
+            return text
+
+        start = match.start()
+        if start > 0 and text[start - 1] == "-":
+            prev = text[start - 2] if start - 2 >= 0 else ""
+            if start == 1 or prev.isspace() or prev in "+-*/%&|^<>()":
+                return text[:start - 1] + text[start:]
+
+        return text[:start] + "-" + text[start:]
+
+    def _append_input(self, current: str, text: str, tail: str = "") -> Optional[str]:
+        """把一段输入（单个按键或整段粘贴）追加到 current，整段只扫描一遍；没有字符被接受时返回 None。
+
+        规则与逐个按键相同：当前为空或 "0" 时不接受运算符，下一个字符替换 "0"；
+        运算符不能紧跟在运算符之后。tail 为插入点之后的内容（不包含在返回值中），
+        以运算符开头时去掉输入末尾的运算符。
+        """
+        text = text.translate(_INPUT_ALIASES)
+        start = 0
+        accepted = False
+        # 开头逐字符处理，直到第一个被接受的非运算符替换掉 "0"
+        while current in ("", "0") and start < len(text):
+            char = text[start]
+            start += 1
+            if char not in _OPERATOR_CHARS:
+                current = char
+                accepted = True
+        rest = text[start:]
+        if len(rest) > 1:
+            rest = _OPERATOR_RUN_PATTERN.sub(r"\1", rest)
+        if rest and current[-1] in _OPERATOR_CHARS:
+            rest = rest.lstrip(_OPERATOR_CHARS)
+        if tail and tail[0] in _OPERATOR_CHARS:
+            rest = rest.rstrip(_OPERATOR_CHARS)
+        if not (accepted or rest):
+            return None
+        return current + rest
+
+    def _extract_last_operation(self, expression: str):
+        """从表达式中提取最后一个运算符和操作数"""
+        # 模式：(数字或字母) (运算符) (数字或字母)
+        pattern = r'([0-9A-Fa-f.]+)\s*(<<|>>|[+\-*/%&|^])\s*([0-9A-Fa-f.]+)$'
+        match = re.search(pattern, expression)
+        
+        if match:
+            last_op_str = match.group(3)
+            self.last_operator = match.group(2)
+            try:
+                if self.mode == "Programmer":
+                    self.last_operand = baseconv.string_to_int(last_op_str, self._base_to_int(self.current_base))
+                else:
+                    self.last_operand = float(last_op_str) if '.' in last_op_str else int(last_op_str)
+            except Exception:
+                self.last_operand = None
+                self.last_operator = None
+        else:
+            self.last_operand = None
+            self.last_operator = None
+
+
+_worker_core = None
+
+
+def run_equals_in_worker(state, expr, repeat_from, count=1, collect_metrics=False):
+    """后台进程入口：按界面状态执行 run_equals，进程内复用同一个 CalculatorCore。
+
+    返回 (run_equals 的结果, 结果的精确数值, 本次记录的指标原始数据或 None)。
+    """
+    global _worker_core
+    if _worker_core is None:
+        _worker_core = CalculatorCore(CalculatorModel())
+    core = _worker_core
+    (core.mode, core.current_base, core.word_size, core.signed,
+     core.last_operator, core.last_operand, core.result_value) = state
+    METRICS.enabled = collect_metrics
+    outcome = core.run_equals(expr, repeat_from, count)
+    return outcome, core.result_value, METRICS.drain() if collect_metrics else None
@@ -1,14 +1,33 @@
-from typing import Union
+from typing import Iterable, Iterator, Union
+
+import baseconv
 
 _UNIT_LABELS = {
     "h": "小时",
     "m": "分钟",
 }
 
+# 整数超过该位数时只显示前若干位与总位数，完整结果在复制/导出时再分块生成
+_LARGE_INT_DIGITS = 1000
+_PREVIEW_DIGITS = 20
+_BITS_PER_DIGIT = {2: 1.0, 8: 3.0, 10: 3.321928094887362, 16: 4.0}
+
+# 统计函数的副标签，与排序结果的 "Sorted" 一致
+_AGGREGATE_LABELS = {
+    "sum": "Sum",
+    "mean": "Mean",
+    "count": "Count",
+    "min": "Min",
+    "max": "Max",
+    "median": "Median",
+}
+
 _ERROR_MESSAGES = {
     "div0": "Error: Div 0",
     "sort": "Error: Sort",
     "time": "Error: Time",
+    "stats": "Error: Stats",
+    "limit": "Error: Too Large",
     "generic": "Error",
 }
 
@@ -26,14 +45,78 @@ def format_result(result: Union[int, float]) -> tuple[str, str]:
             return str(int(rounded)), ""
         return str(rounded), ""
 
+    if is_large_int(result):
+        return format_large_int(result)
     return str(result), ""
 
 
+def is_large_int(value: int, base: int = 10) -> bool:
+    """按位长估算在 base 进制下是否超过完整显示的位数上限"""
+    return abs(value).bit_length() > _LARGE_INT_DIGITS * _BITS_PER_DIGIT[base]
+
+
+def format_large_int(value: int, base: int = 10) -> tuple[str, str]:
+    """超大整数的预览：十进制为科学计数法（前若干位 + 指数），其他进制为前若干位加省略号；副标签为总位数。"""
+    sign = "-" if value < 0 else ""
+    lead, digits = baseconv.leading_digits(abs(value), _PREVIEW_DIGITS, base)
+    if base == 10:
+        text = f"{sign}{lead[0]}.{lead[1:]}…e+{digits - 1}"
+    else:
+        text = f"{sign}{lead}…"
+    return text, f"{digits} digits"
+
+
+def iter_full_result(value: int, base: int = 10, chunk_size: int = 1 << 16) -> Iterator[str]:
+    """按需生成整数的完整文本并分块产出（用于复制/导出），不构造完整字符串。"""
+    return baseconv.iter_int_string(value, base, chunk_size)
+
+
 def format_sorted_numbers(numbers: list[Union[int, float]]) -> tuple[str, str]:
     parts = [_format_number_no_trailing_zero(n) for n in numbers]
     return ",".join(parts), "Sorted"
 
 
+def format_sorted_numbers_stream(
+    numbers: Iterable[Union[int, float]],
+    chunk_size: int = 4096,
+) -> tuple[Iterator[str], str]:
+    """与 format_sorted_numbers 相同的格式，但以生成器分块产出文本，适合超大结果。"""
+    def pieces():
+        batch = []
+        first = True
+        for n in numbers:
+            batch.append(_format_number_no_trailing_zero(n))
+            if len(batch) >= chunk_size:
+                yield ("" if first else ",") + ",".join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield ("" if first else ",") + ",".join(batch)
+
+    return pieces(), "Sorted"
+
+
+def format_aggregate(
+    func: str,
+    arg: Union[int, float, None],
+    result: Union[int, float, list[Union[int, float]]],
+) -> tuple[str, str]:
+    """统计结果：top / bottom 的列表按排序结果的格式以逗号连接，单个数值按 format_result 显示；
+    副标签为统计名（如 "Median"、"P90"、"Top 5"）。"""
+    if func == "percentile":
+        label = f"P{_format_number_no_trailing_zero(arg)}"
+    elif func in ("top", "bottom"):
+        label = f"{func.capitalize()} {arg}"
+    else:
+        label = _AGGREGATE_LABELS[func]
+
+    if isinstance(result, list):
+        return ",".join(_format_number_no_trailing_zero(n) for n in result), label
+    text, sub_label = format_result(result)
+    # 超大整数的预览副标签是总位数，保留在统计名之后
+    return text, f"{label} · {sub_label}" if sub_label else label
+
+
 def format_time_conversion(
     converted_value: float,
     converted_unit: str,
@@ -48,5 +131,35 @@ def format_time_conversion(
     return converted_text, original_text
 
 
+def format_time_conversions(
+    converted_values: Iterable[float],
+    original_units: str,
+    chunk_size: int = 4096,
+) -> tuple[Iterator[str], str]:
+    """format_time_conversion 的批量版本：各项的换算结果以逗号连接并分块产出，副标签为项数。"""
+    def pieces():
+        batch = []
+        first = True
+        for value, unit in zip(converted_values, original_units):
+            converted_unit = "m" if unit == "h" else "h"
+            batch.append(f"{_format_number_no_trailing_zero(value)}{_UNIT_LABELS[converted_unit]}")
+            if len(batch) >= chunk_size:
+                yield ("" if first else ",") + ",".join(batch)
+                first = False
+                batch = []
+        if batch:
+            yield ("" if first else ",") + ",".join(batch)
+
+    return pieces(), f"{len(original_units)} items"
+
+
+def format_pending() -> str:
+    return "Computing…"
+
+
+def format_preview(result_text: str) -> str:
+    return f"= {result_text}" if result_text else ""
+
+
 def format_error(kind: str) -> tuple[str, str]:
     return _ERROR_MESSAGES.get(kind, _ERROR_MESSAGES["generic"]), ""
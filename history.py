@@ -0,0 +1,342 @@
+"""持久化的计算历史。
+
+每条记录以一行 JSON 追加写入日志文件，并维护紧凑的索引：
+- <log>.idx：array('Q')，第 n 项为第 n 条记录在日志中的字节偏移，按编号读取为 O(1)；
+- <log>.pfx.<start>-<end>：若干有序段，每段是编号区间 [start, end) 内的记录按表达式
+  排序后的编号数组，旁边的 .keys 文件按同样顺序保存表达式（结束位置数组 + UTF-8 文本），
+  归并时只顺序读取这两个文件，不解码日志。新记录先进入内存中的小缓冲区，缓冲区满时
+  写成新段，相邻的同级段像二进制计数器一样归并，但归并后的段不超过 _MAX_SEGMENT_SIZE
+  条，因此 append 中的单次归并耗时有上限；每段内前缀查找为二分。
+读取通过 mmap 进行，启动时只加载缓冲区中的少量记录；日志比索引新时只扫描缺失的尾部。
+同一组文件只允许一个实例写入：打开时对 <log>.lock 加非阻塞排他锁，已被占用则抛出 HistoryLockedError。
+"""
+import heapq
+import itertools
+import json
+import mmap
+import os
+import re
+import time
+from array import array
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_OFFSET_TYPE = 'Q'
+_OFFSET_SIZE = array(_OFFSET_TYPE).itemsize
+# 内存缓冲区容量：超过后写成一个有序段
+_BUFFER_SIZE = 256
+# 归并后单个有序段的最大条数：限制一次 append 中归并的工作量
+_MAX_SEGMENT_SIZE = 1 << 15
+_SEGMENT_PATTERN = re.compile(r"\.pfx\.(\d+)-(\d+)$")
+
+
+class HistoryLockedError(OSError):
+    """历史文件已被另一个实例占用"""
+
+
+def _lock_file(f):
+    """对文件加非阻塞排他锁，进程退出或文件关闭时自动释放"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError as e:
+        raise HistoryLockedError(f"{f.name} is in use by another instance") from e
+
+
+def _is_entry(line: bytes) -> bool:
+    """判断一行是否为完整可解析的记录"""
+    try:
+        return isinstance(json.loads(line)["expression"], str)
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+class HistoryStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = open(path + ".lock", "ab")
+        try:
+            _lock_file(self._lock)
+        except OSError:
+            self._lock.close()
+            raise
+        self._log = open(path, "ab+")
+        self._index = open(self.index_path, "ab+")
+        self._log_map = None
+        self._index_map = None
+        self._segment_maps = {}
+        self._recover()
+        self._load_segments()
+
+    # ================= 公共接口 =================
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, expression: str, mode: str, base: str, result: str, timestamp: Optional[float] = None) -> int:
+        """追加一条记录并返回其编号"""
+        entry = {
+            "expression": expression,
+            "mode": mode,
+            "base": base,
+            "result": result,
+            "timestamp": time.time() if timestamp is None else timestamp,
+        }
+        line = json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n"
+        self._log.seek(0, os.SEEK_END)
+        offset = self._log.tell()
+        self._log.write(line)
+        self._log.flush()
+        self._index.seek(0, os.SEEK_END)
+        self._index.write(array(_OFFSET_TYPE, [offset]).tobytes())
+        self._index.flush()
+        self._release_maps()
+
+        self._count += 1
+        self._buffer.append(expression)
+        if len(self._buffer) >= _BUFFER_SIZE:
+            self._flush_buffer()
+        return self._count - 1
+
+    def get(self, n: int) -> dict:
+        """按编号读取记录，支持负数下标"""
+        return json.loads(self._read_line(self._normalize(n)))
+
+    def recent(self, count: int) -> list[dict]:
+        """最近的 count 条记录，从新到旧"""
+        return [self.get(n) for n in range(self._count - 1, max(self._count - count, 0) - 1, -1)]
+
+    def search_prefix(self, prefix: str, limit: Optional[int] = None) -> list[int]:
+        """返回表达式以 prefix 开头的记录编号，从新到旧；limit 限制返回条数"""
+        if not prefix:
+            stop = -1 if limit is None else max(self._count - limit, 0) - 1
+            return list(range(self._count - 1, stop, -1))
+        buffer_start = self._count - len(self._buffer)
+        matches = []
+        for i in range(len(self._buffer) - 1, -1, -1):
+            if limit is not None and len(matches) >= limit:
+                return matches
+            if self._buffer[i].startswith(prefix):
+                matches.append(buffer_start + i)
+        for segment in reversed(self._segments):
+            if limit is None:
+                matches.extend(sorted(self._segment_matches(segment, prefix), reverse=True))
+                continue
+            remaining = limit - len(matches)
+            if remaining <= 0:
+                break
+            # 段内按表达式排序：二分定出匹配区间后只取其中编号最大的 remaining 个，不逐条读取表达式
+            matches.extend(heapq.nlargest(remaining, self._segment_matches(segment, prefix)))
+        return matches
+
+    def close(self):
+        self._release_maps()
+        for mapped in self._segment_maps.values():
+            mapped.close()
+        self._segment_maps.clear()
+        self._log.close()
+        self._index.close()
+        self._lock.close()
+
+    # ================= 内部逻辑方法 =================
+
+    def _normalize(self, n: int) -> int:
+        if n < 0:
+            n += self._count
+        if not 0 <= n < self._count:
+            raise IndexError("history index out of range")
+        return n
+
+    def _recover(self):
+        """对齐日志与偏移索引：只扫描索引之后新增的日志尾部，丢弃写了一半的末行，跳过无法解析的行"""
+        log_size = os.path.getsize(self.path)
+        index_size = os.path.getsize(self.index_path)
+        self._count = index_size // _OFFSET_SIZE
+        if index_size % _OFFSET_SIZE:
+            self._truncate_index(self._count)
+
+        # 索引指向日志之外（日志被截断）时从头重建
+        if self._count and self._offset(self._count - 1) >= log_size:
+            self._truncate_index(0)
+
+        scan_from = 0
+        if self._count:
+            self._log.seek(self._offset(self._count - 1))
+            self._log.readline()
+            scan_from = self._log.tell()
+
+        if scan_from < log_size:
+            missing = array(_OFFSET_TYPE)
+            self._log.seek(scan_from)
+            position = scan_from
+            for line in self._log:
+                if not line.endswith(b"\n"):
+                    break
+                if _is_entry(line):
+                    missing.append(position)
+                position += len(line)
+            if position < log_size:
+                self._log.truncate(position)
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(missing.tobytes())
+            self._index.flush()
+            self._count += len(missing)
+        self._release_maps()
+
+    def _load_segments(self):
+        """读取有序段列表；段不连续或超出记录数时全部丢弃，由缓冲区重新积累"""
+        directory = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + ".pfx."
+        found = []
+        for name in os.listdir(directory):
+            if not name.startswith(prefix):
+                continue
+            match = _SEGMENT_PATTERN.search(name)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2))))
+        found.sort()
+
+        segments = []
+        expected = 0
+        for start, end in found:
+            if start != expected or end > self._count or not os.path.exists(self._keys_path((start, end))):
+                break
+            segments.append((start, end))
+            expected = end
+        for segment in found[len(segments):]:
+            self._remove_segment(segment)
+
+        self._segments = segments
+        self._buffer = [self._expression_at(n) for n in range(expected, self._count)]
+        while len(self._buffer) >= _BUFFER_SIZE:
+            self._flush_buffer(_BUFFER_SIZE)
+
+    def _segment_path(self, segment) -> str:
+        return f"{self.path}.pfx.{segment[0]}-{segment[1]}"
+
+    def _keys_path(self, segment) -> str:
+        return self._segment_path(segment) + ".keys"
+
+    def _remove_segment(self, segment):
+        mapped = self._segment_maps.pop(segment, None)
+        if mapped is not None:
+            mapped.close()
+        for path in (self._segment_path(segment), self._keys_path(segment)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _truncate_index(self, count: int):
+        self._release_maps()
+        self._index.truncate(count * _OFFSET_SIZE)
+        self._count = count
+
+    def _release_maps(self):
+        for name in ("_log_map", "_index_map"):
+            mapped = getattr(self, name)
+            if mapped is not None:
+                mapped.close()
+                setattr(self, name, None)
+
+    def _offset(self, n: int) -> int:
+        if self._index_map is None:
+            self._index_map = mmap.mmap(self._index.fileno(), 0, access=mmap.ACCESS_READ)
+        start = n * _OFFSET_SIZE
+        return array(_OFFSET_TYPE, self._index_map[start:start + _OFFSET_SIZE])[0]
+
+    def _read_line(self, n: int) -> bytes:
+        if self._log_map is None:
+            self._log_map = mmap.mmap(self._log.fileno(), 0, access=mmap.ACCESS_READ)
+        start = self._offset(n)
+        end = self._log_map.find(b"\n", start)
+        return self._log_map[start:end]
+
+    def _expression_at(self, n: int) -> str:
+        return json.loads(self._read_line(n))["expression"]
+
+    def _segment_id(self, segment, i: int) -> int:
+        mapped = self._segment_maps.get(segment)
+        if mapped is None:
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = self._segment_maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = i * _OFFSET_SIZE
+        return array(_OFFSET_TYPE, mapped[start:start + _OFFSET_SIZE])[0]
+
+    def _segment_matches(self, segment, prefix: str) -> Iterator[int]:
+        """在一个有序段内二分定出以 prefix 开头的区间，并产出其中的编号"""
+        size = segment[1] - segment[0]
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._expression_at(self._segment_id(segment, mid)) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._expression_at(self._segment_id(segment, mid)).startswith(prefix):
+                lo = mid + 1
+            else:
+                hi = mid
+        for i in range(start, lo):
+            yield self._segment_id(segment, i)
+
+    def _read_segment(self, segment) -> list[tuple[str, int]]:
+        """按段内顺序读出 (表达式, 编号)；段不超过 _MAX_SEGMENT_SIZE 条，可整体读入内存"""
+        ids = array(_OFFSET_TYPE)
+        with open(self._segment_path(segment), "rb") as f:
+            ids.frombytes(f.read())
+        with open(self._keys_path(segment), "rb") as f:
+            data = f.read()
+        # .keys：每条表达式的结束位置（按字符计，array('Q')），随后是全部表达式拼接的 UTF-8 文本
+        header = len(ids) * _OFFSET_SIZE
+        ends = array(_OFFSET_TYPE, data[:header])
+        text = data[header:].decode("utf-8")
+        keys = [text[start:end] for start, end in zip(itertools.chain((0,), ends), ends)]
+        return list(zip(keys, ids))
+
+    def _write_segment(self, segment, entries: list[tuple[str, int]]):
+        """写出有序段及其 .keys 文件；编号文件最后替换，加载时以它和 .keys 同时存在为准"""
+        temp_path = self._segment_path(segment) + ".tmp"
+        temp_keys = self._keys_path(segment) + ".tmp"
+        expressions = [expression for expression, _ in entries]
+        with open(temp_keys, "wb") as out:
+            array(_OFFSET_TYPE, itertools.accumulate(map(len, expressions))).tofile(out)
+            out.write("".join(expressions).encode("utf-8"))
+        with open(temp_path, "wb") as out:
+            array(_OFFSET_TYPE, [n for _, n in entries]).tofile(out)
+        os.replace(temp_keys, self._keys_path(segment))
+        os.replace(temp_path, self._segment_path(segment))
+
+    def _flush_buffer(self, size: Optional[int] = None):
+        """把缓冲区（前 size 条）写成有序段，并归并大小不超过它的前一段"""
+        size = len(self._buffer) if size is None else size
+        start = self._segments[-1][1] if self._segments else 0
+        keyed = sorted((expression, start + i) for i, expression in enumerate(self._buffer[:size]))
+        segment = (start, start + size)
+        self._write_segment(segment, keyed)
+        self._segments.append(segment)
+        del self._buffer[:size]
+
+        while len(self._segments) >= 2:
+            older, newer = self._segments[-2], self._segments[-1]
+            older_size, newer_size = older[1] - older[0], newer[1] - newer[0]
+            if older_size > newer_size or older_size + newer_size > _MAX_SEGMENT_SIZE:
+                break
+            merged = (older[0], newer[1])
+            # 两段各自有序，sorted 按两个有序段线性归并
+            self._write_segment(merged, sorted(self._read_segment(older) + self._read_segment(newer)))
+            for part in (older, newer):
+                self._remove_segment(part)
+            self._segments[-2:] = [merged]
@@ -1,24 +1,169 @@
-import customtkinter as ctk
-from model import CalculatorModel
-from view import CalculatorView
-from controller import CalculatorController
+import argparse
+import os
+import sys
 
-# 设置全局主题
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
+from model import CalculatorModel, WORD_SIZES
+from core import CalculatorCore
+from history import HistoryStore
+from metrics import METRICS
+
+# 图形界面默认的历史记录位置
+_DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".simple_calculator", "history.jsonl")
+
+
+def _open_history(path):
+    """打开历史记录；目录不可写、已被其他实例占用或文件损坏时返回 None，不影响计算"""
+    try:
+        return HistoryStore(path)
+    except (OSError, ValueError) as e:
+        print(f"history disabled: {e}", file=sys.stderr)
+        return None
+
+
+def run_gui(trace_mode_switch=False, history_path=_DEFAULT_HISTORY_PATH):
+    """启动图形界面（仅在此处导入 customtkinter）"""
+    import customtkinter as ctk
+    from view import CalculatorView
+    from controller import CalculatorController
+
+    # 设置全局主题
+    ctk.set_appearance_mode("dark")
+    ctk.set_default_color_theme("blue")
 
-if __name__ == "__main__":
     # 1. 创建模型
     model = CalculatorModel()
-    
+
     # 2. 创建视图
     view = CalculatorView()
-    
+
     # 3. 创建控制器，并将模型和视图绑定
     controller = CalculatorController(model, view)
-    
+    controller.history = _open_history(history_path)
+
     # 4. 将控制器反向注入视图，以便视图能触发事件
     view.set_controller(controller)
-    
+    if trace_mode_switch:
+        controller.mode_switch_hook = lambda mode, seconds: print(
+            f"mode switch -> {mode}: {seconds * 1000:.1f} ms", file=sys.stderr
+        )
+
     # 5. 启动主循环
-    view.mainloop()
\ No newline at end of file
+    try:
+        view.mainloop()
+    finally:
+        controller.shutdown()
+        if controller.history is not None:
+            controller.history.close()
+
+
+def run_batch(lines, out, mode="Standard", base="DEC", history=None, word=None, signed=True):
+    """逐行读取表达式并流式输出格式化结果，规则与界面上按 "=" 一致"""
+    core = CalculatorCore(CalculatorModel())
+    core.mode = mode
+    core.current_base = base
+    core.word_size = WORD_SIZES.get(word)
+    core.signed = signed
+    core.history = history
+
+    with METRICS.time("batch"):
+        _run_batch_lines(core, lines, out, mode)
+
+
+def _run_batch_lines(core, lines, out, mode):
+    for line in lines:
+        METRICS.count("batch_lines")
+        expr = line.strip()
+        if not expr:
+            # 空行原样保留，保证输出与输入逐行对应
+            out.write("\n")
+            continue
+        if ',' in expr and not core.is_aggregate(expr):
+            # 排序/批量换算结果分块写出，不拼接成完整字符串
+            pieces, _ = core.stream_time(expr) if mode == "Time" else core.stream_sort(expr)
+            out.writelines(pieces)
+            out.write("\n")
+            continue
+        core.result_value = None
+        result_str, _ = core.evaluate_expression(expr)
+        core.record_history(expr, result_str)
+        _write_result(core, result_str, out)
+
+
+def _write_result(core, result_str, out):
+    # 显示文本对超大整数只是预览，输出时按块写出完整结果
+    chunks = core.iter_result_text()
+    if chunks is None:
+        out.write(result_str)
+    else:
+        out.writelines(chunks)
+    out.write("\n")
+
+
+def run_history_commands(history, out, recent=0, rerun=()):
+    """列出最近 recent 条历史（编号、模式、进制、表达式、结果，以 Tab 分隔），
+    再按各记录当时的模式与进制重新计算 rerun 中的编号（负数从末尾倒数）"""
+    newest = len(history) - 1
+    for i, entry in enumerate(history.recent(recent)):
+        fields = (str(newest - i), entry["mode"], entry["base"], entry["expression"], entry["result"])
+        out.write("\t".join(field.replace("\n", "\\n") for field in fields) + "\n")
+
+    core = CalculatorCore(CalculatorModel())
+    core.history = history
+    for n in rerun:
+        try:
+            result_str, _ = core.rerun_history(n)
+        except IndexError:
+            print(f"history entry {n} does not exist", file=sys.stderr)
+            continue
+        _write_result(core, result_str, out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="简易计算器")
+    parser.add_argument("--batch", action="store_true", help="无界面模式：逐行计算表达式并输出结果")
+    parser.add_argument("--mode", choices=["Standard", "Programmer", "Time"], default="Standard")
+    parser.add_argument("--base", choices=["HEX", "DEC", "OCT", "BIN"], default="DEC",
+                        help="程序员模式下输入与输出使用的进制")
+    parser.add_argument("--word", choices=list(WORD_SIZES),
+                        help="程序员模式下按定长整数计算（缺省不限位宽）")
+    parser.add_argument("--unsigned", action="store_true", help="定长整数按无符号解释")
+    parser.add_argument("--trace-mode-switch", action="store_true",
+                        help="图形界面下把每次模式切换的耗时输出到标准错误")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="开启分阶段计时，退出时写出快照（.prom/.txt 为 Prometheus 文本，其余为 JSON）")
+    parser.add_argument("--history", metavar="PATH",
+                        help=f"历史记录文件（图形界面默认 {_DEFAULT_HISTORY_PATH}；批处理仅在指定时记录）")
+    parser.add_argument("--recent", type=int, default=0, metavar="K",
+                        help="列出历史中最近的 K 条记录（带编号）后退出")
+    parser.add_argument("--rerun", type=int, action="append", metavar="N",
+                        help="按当时的模式与进制重新计算第 N 条历史记录（负数从末尾倒数，可重复）后退出")
+    parser.add_argument("input", nargs="?", help="表达式文件，缺省或为 - 时读取标准输入")
+    args = parser.parse_args(argv)
+    METRICS.enabled = bool(args.metrics)
+
+    history = None
+    try:
+        if args.recent or args.rerun:
+            history = _open_history(args.history or _DEFAULT_HISTORY_PATH)
+            if history is not None:
+                run_history_commands(history, sys.stdout, args.recent, args.rerun or ())
+            return
+        if not args.batch:
+            run_gui(args.trace_mode_switch, args.history or _DEFAULT_HISTORY_PATH)
+            return
+        if args.history:
+            history = _open_history(args.history)
+        if args.input and args.input != "-":
+            with open(args.input, encoding="utf-8") as f:
+                run_batch(f, sys.stdout, args.mode, args.base, history, args.word, not args.unsigned)
+        else:
+            run_batch(sys.stdin, sys.stdout, args.mode, args.base, history, args.word, not args.unsigned)
+    finally:
+        if history is not None:
+            history.close()
+        if args.metrics:
+            METRICS.write(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""可选的分阶段计时与计数。
+
+默认关闭；关闭时 METRICS.time() 返回共享的空上下文管理器，开销只有一次
+属性判断。开启后按阶段记录耗时直方图、事件计数与错误类型计数，可导出
+JSON 或 Prometheus 文本格式的快照。
+"""
+import bisect
+import contextlib
+import json
+import time
+
+# 直方图桶上界（秒）：1us 到约 33s，按 2 倍递增
+_BUCKET_BOUNDS = tuple(1e-6 * 2 ** i for i in range(26))
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Histogram:
+    """固定桶的耗时直方图"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(_BUCKET_BOUNDS) + 1)  # 最后一个桶为 +Inf
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+
+    def merge(self, count: int, total: float, buckets: list[int]):
+        self.count += count
+        self.total += total
+        for i, n in enumerate(buckets):
+            self.buckets[i] += n
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return _BUCKET_BOUNDS[i] if i < len(_BUCKET_BOUNDS) else float("inf")
+        return float("inf")
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.events = {}
+        self.errors = {}
+
+    def time(self, stage: str):
+        """计时上下文：with METRICS.time("parse"): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.events[name] = self.events.get(name, 0) + n
+
+    def error(self, kind: str):
+        if self.enabled:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def drain(self) -> dict:
+        """取出原始数据并清空，用于把后台进程中的记录传回界面进程"""
+        raw = {
+            "stages": {name: (h.count, h.total, h.buckets) for name, h in self.stages.items()},
+            "events": self.events,
+            "errors": self.errors,
+        }
+        self.reset()
+        return raw
+
+    def merge(self, raw: dict):
+        for name, (count, total, buckets) in raw["stages"].items():
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram()
+            histogram.merge(count, total, buckets)
+        for name, n in raw["events"].items():
+            self.events[name] = self.events.get(name, 0) + n
+        for kind, n in raw["errors"].items():
+            self.errors[kind] = self.errors.get(kind, 0) + n
+
+    def snapshot(self) -> dict:
+        return {
+            "stages": {
+                name: {
+                    "count": h.count,
+                    "total_seconds": h.total,
+                    "mean_seconds": h.total / h.count if h.count else 0.0,
+                    "p50_seconds": h.quantile(0.50),
+                    "p99_seconds": h.quantile(0.99),
+                }
+                for name, h in sorted(self.stages.items())
+            },
+            "events": dict(sorted(self.events.items())),
+            "errors": dict(sorted(self.errors.items())),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self) -> str:
+        lines = ["# TYPE calculator_stage_seconds histogram"]
+        for name, h in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, n in zip(_BUCKET_BOUNDS, h.buckets):
+                cumulative += n
+                lines.append(f'calculator_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'calculator_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+            lines.append(f'calculator_stage_seconds_sum{{stage="{name}"}} {h.total:.9f}')
+            lines.append(f'calculator_stage_seconds_count{{stage="{name}"}} {h.count}')
+        lines.append("# TYPE calculator_events_total counter")
+        for name, n in sorted(self.events.items()):
+            lines.append(f'calculator_events_total{{name="{name}"}} {n}')
+        lines.append("# TYPE calculator_errors_total counter")
+        for kind, n in sorted(self.errors.items()):
+            lines.append(f'calculator_errors_total{{kind="{kind}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """写出快照：.prom / .txt 使用 Prometheus 文本格式，其余使用 JSON"""
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+METRICS = Metrics()
@@ -1,9 +1,121 @@
 import ast
+import heapq
+import math
 import operator
-from typing import Union
+import os
+import random
+import re
+import tempfile
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Mapping, Optional, Union
+
+import calc_parser
+from metrics import METRICS
+
+# NumPy 为可选依赖，首次用到时由 _numpy() 导入（导入本模块时不加载）；缺失时退回纯 Python
+np = None
+_numpy_checked = False
+
+# 批量计算：少于该数量时直接在当前进程内计算
+_PARALLEL_THRESHOLD = 2000
+# 每个工作进程平均分到的块数，块越多负载越均衡
+_CHUNKS_PER_WORKER = 4
+
+# 大数据量排序：默认内存预算（字节），超出后分段排序并写入临时文件
+_SORT_MEMORY_BUDGET = 64 * 1024 * 1024
+# 纯 Python 排序时每个数值的峰值开销估计（装箱对象 + 列表指针 + 数组槽位）
+_SORT_BYTES_PER_ITEM = 48
+# 从临时文件回读时每次读取的数值个数
+_SORT_READ_BLOCK = 8192
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_TOKEN_PATTERN = re.compile(r"[^,]+")
+# 不超过该绝对值的整数可以无损转换为 float64
+_FLOAT_EXACT_INT = 1 << 53
+
+# 复合时长中的一个 "<数值><h|m>" 片段，两侧允许空白
+_TIME_PART_PATTERN = re.compile(r"\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)\s*([hHmM])\s*")
+_OTHER_TIME_UNIT = {"h": "m", "m": "h"}
+# 时间换算列表、排序与统计的数据达到该项数时才导入并使用 NumPy
+_TIME_VECTOR_THRESHOLD = 256
+
+# 计算预算默认值：单步结果的最大位数，以及单步运算的最大代价（按 30 位“数字”计的基本操作数）
+_DEFAULT_MAX_BITS = 1 << 20
+_DEFAULT_MAX_COST = 1 << 28
+
+# 重复运算没有闭式解时逐步计算的最大步数
+_ITERATE_LOOP_LIMIT = 10_000_000
+
+# 程序员模式可选的定长整数字长（位数）
+WORD_SIZES = {"BYTE": 8, "WORD": 16, "DWORD": 32, "QWORD": 64}
+
+
+class EvaluationLimitError(ArithmeticError):
+    """表达式的某一步运算预计超出计算预算"""
+
+
+_MISSING = object()
+
+
+class _LRUCache:
+    """有界 LRU 缓存，记录命中/未命中/淘汰次数。"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize: int):
+        self.maxsize = maxsize
+        while len(self._data) > max(maxsize, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def info(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
 
 class CalculatorModel:
-    def __init__(self):
+    def __init__(
+        self,
+        cache_size: int = 256,
+        max_bits: Optional[int] = _DEFAULT_MAX_BITS,
+        max_cost: Optional[int] = _DEFAULT_MAX_COST,
+    ):
         # 支持的二元运算符映射
         self._bin_ops = {
             ast.Add: operator.add,
@@ -23,14 +135,317 @@ class CalculatorModel:
             ast.USub: operator.neg,
             ast.Invert: lambda x: ~x,
         }
+        # 构造器生成的二元运算函数，按 (构造器参数, 运算符类型) 复用
+        self._op_funcs = {}
+        # 直接求值的构造器不保存解析状态，按 (use_int_div, 字长) 复用
+        self._value_builders = {}
+        # 表达式缓存：(expression, use_int_div, 字长, 进制) -> 计算结果；公式另以 "formula" 为键缓存编译结果
+        self._cache = _LRUCache(cache_size)
+        # 计算预算：整数运算前估算结果位数与运算代价，超出即拒绝；None 表示不限制
+        self.max_bits = max_bits
+        self.max_cost = max_cost
+
+    def evaluate(
+        self,
+        expression: str,
+        mode: str,
+        word_size: Optional[int] = None,
+        signed: bool = True,
+        base: int = 10,
+    ) -> Union[int, float]:
+        """计算表达式并返回数值结果。
+
+        程序员模式下数字字面量按 base 进制（2/8/10/16）直接读取，其他模式始终为
+        十进制。程序员模式下 word_size 为位数（见 WORD_SIZES）时按定长整数计算：常量与
+        每一步运算结果都截断到该位宽（signed 决定按有符号还是无符号解释），
+        此时不做预算检查。否则任一步整数运算预计超出 max_bits / max_cost 时
+        抛出 EvaluationLimitError。
+        """
+        if not expression:
+            raise ValueError("Empty expression")
+
+        use_int_div = (mode == "Programmer")
+        word = (word_size, signed) if use_int_div and word_size else None
+        base = base if use_int_div else 10
+        key = (expression, use_int_div, word, base)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+
+        result = self._compute(expression, use_int_div, word, base)
+        self._cache.put(key, result)
+        return result
+
+    def evaluate_many(
+        self,
+        expressions: Iterable[str],
+        mode: str,
+        workers: Optional[int] = None,
+    ) -> list[tuple[Optional[Union[int, float]], Optional[str]]]:
+        """批量计算表达式，按输入顺序返回 (结果, 错误类型) 列表。
+
+        单条失败不会中断整批；错误类型与 formatter.format_error 一致
+        （"div0"、"limit" 或 "generic"），成功时错误类型为 None。
+        批量较大时按块分发到进程池，workers 为 None 时使用全部 CPU，
+        workers <= 1 时始终在当前进程内计算。
+        """
+        expressions = list(expressions)
+        with METRICS.time("batch"):
+            results = self._evaluate_batch(expressions, mode, workers)
+
+        if METRICS.enabled:
+            METRICS.count("batch_items", len(results))
+            for _, kind in results:
+                if kind is not None:
+                    METRICS.error(kind)
+        return results
+
+    def _evaluate_batch(self, expressions: list[str], mode: str, workers: Optional[int]):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(expressions) < _PARALLEL_THRESHOLD:
+            return self._evaluate_chunk(expressions, mode)
+
+        from concurrent.futures import ProcessPoolExecutor  # 仅大批量时才需要进程池
+
+        chunk_size = -(-len(expressions) // (workers * _CHUNKS_PER_WORKER))
+        chunks = [expressions[i:i + chunk_size] for i in range(0, len(expressions), chunk_size)]
+        results = []
+        # 工作进程按当前模型的缓存容量与计算预算创建自己的模型实例
+        config = (self._cache.maxsize, self.max_bits, self.max_cost)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=config) as pool:
+            for part in pool.map(_evaluate_chunk, chunks, [mode] * len(chunks)):
+                results.extend(part)
+        return results
+
+    def evaluate_vectorized(
+        self,
+        expression: str,
+        mode: str,
+        variables: Mapping[str, object],
+        word_size: Optional[int] = None,
+        signed: bool = True,
+    ):
+        """对含变量的表达式做一次编译，并在变量绑定的数组上整体求值。
+
+        variables 将变量名映射到数组（或序列、标量）。运算符白名单与
+        evaluate 相同，程序员模式下除法逐元素向下取整，任一除数为 0 时
+        抛出 ZeroDivisionError。安装了 NumPy 时返回 ndarray（整数按 NumPy
+        定长类型运算；指定 word_size 时使用对应的原生 int8..uint64 类型），
+        否则逐元素计算并返回 list。
+        """
+        if not expression:
+            raise ValueError("Empty expression")
+
+        use_int_div = (mode == "Programmer")
+        word = (word_size, signed) if use_int_div and word_size else None
+        names: set = set()
+        fn = self._compile(expression, use_int_div, names, word)
+        missing = names - variables.keys()
+        if missing:
+            raise ValueError(f"未绑定的变量: {', '.join(sorted(missing))}")
+
+        if _numpy() is not None:
+            if word is not None:
+                dtype = _word_dtype(*word)
+                env = {name: np.asarray(variables[name]).astype(dtype) for name in names}
+            else:
+                env = {name: np.asarray(variables[name]) for name in names}
+            with np.errstate(all="ignore"):
+                return np.asarray(fn(env))
+
+        columns = {name: variables[name] for name in names}
+        length = None
+        for value in columns.values():
+            if hasattr(value, "__len__"):
+                if length is not None and len(value) != length:
+                    raise ValueError("变量数组长度不一致")
+                length = len(value)
+        if length is None:
+            return fn(columns)
 
-    def evaluate(self, expression: str, mode: str) -> Union[int, float]:
-        """计算表达式并返回数值结果。"""
+        results = []
+        for i in range(length):
+            env = {
+                name: value[i] if hasattr(value, "__len__") else value
+                for name, value in columns.items()
+            }
+            results.append(fn(env))
+        return results
+
+    def iterate(
+        self,
+        value: Union[int, float],
+        symbol: str,
+        operand: Union[int, float],
+        count: int,
+        mode: str,
+        word_size: Optional[int] = None,
+        signed: bool = True,
+        modulus: Optional[int] = None,
+    ) -> Union[int, float]:
+        """把 `value <symbol> operand` 连续应用 count 次，不经过表达式解析。
+
+        有闭式解时直接计算：+k / -k 为 ±count*k，*k 为 *k**count（给出 modulus
+        或定长整数时用模幂），移位把移位量相加，^ 按次数奇偶，& | % 只需一次，
+        /k（k > 0 的整数除法或浮点除法）为 /k**count。其余情况逐步计算，遇到
+        不动点提前结束。modulus 表示每一步结果都对其取模。
+        """
+        if count < 0:
+            raise ValueError("count must be non-negative")
+        if symbol not in _SYMBOL_OPS:
+            raise ValueError(f"不支持的运算符: {symbol}")
+        op_type = _SYMBOL_OPS[symbol]
+        func = self._bin_ops[op_type]
+        use_int_div = (mode == "Programmer")
+        if use_int_div and op_type is ast.Div:
+            func = operator.floordiv
+
+        bits = word_size if use_int_div and word_size else None
+        wrap = _make_wrapper(bits, signed) if bits else None
+        if wrap is not None:
+            value = wrap(value)
+            operand = wrap(operand)
+        if op_type in (ast.Div, ast.Mod) and operand == 0:
+            raise ZeroDivisionError
+
+        def finish(result):
+            if modulus is not None:
+                result %= modulus
+            return wrap(result) if wrap is not None else result
+
+        if count == 0:
+            return value
+        with METRICS.time("iterate"):
+            result = self._iterate_closed_form(value, op_type, operand, count, use_int_div, bits, modulus)
+            if result is not None:
+                return finish(result)
+
+            # 逐步计算：闭包只做一次运算与截断，不再解析表达式
+            for _ in range(min(count, _ITERATE_LOOP_LIMIT)):
+                if type(value) is int and type(operand) is int and op_type in _GROWING_OPS and bits is None:
+                    self._check_budget(op_type, value, operand)
+                new_value = finish(func(value, operand))
+                if new_value == value:
+                    return value
+                value = new_value
+            if count > _ITERATE_LOOP_LIMIT:
+                raise EvaluationLimitError(f"重复次数 {count} 超出逐步计算上限 {_ITERATE_LOOP_LIMIT}")
+            return value
+
+    def _iterate_closed_form(
+        self,
+        value,
+        op_type,
+        operand,
+        count: int,
+        use_int_div: bool,
+        bits: Optional[int],
+        modulus: Optional[int],
+    ):
+        """iterate 的闭式解；没有闭式解时返回 None。结果尚未取模/截断"""
+        is_int = type(value) is int and type(operand) is int
+        if op_type in (ast.Add, ast.Sub):
+            if is_int and bits is None:
+                self._check_budget(ast.Mult, count, operand)
+            step = count * operand
+            return value + step if op_type is ast.Add else value - step
+
+        if op_type is ast.Mult:
+            if modulus is not None and not is_int:
+                return None
+            if not value or operand in (0, 1):
+                # 0 与乘 0 / 乘 1 是不动点，一步之后结果不再变化
+                return value * operand
+            if not is_int:
+                # 浮点按浮点幂计算，溢出时抛出 OverflowError，不构造巨大的整数
+                return value * float(operand) ** count
+            if modulus is not None or bits is not None:
+                mod = modulus if modulus is not None else 1 << bits
+                return value * pow(operand, count, mod)
+            if abs(operand) > 1:
+                grown = value.bit_length() + count * operand.bit_length()
+                if self.max_bits is not None and grown > self.max_bits:
+                    raise EvaluationLimitError(f"结果约 {grown} 位，超出上限 {self.max_bits} 位")
+            return value * operand ** count
+
+        if modulus is not None:
+            return None
+
+        if op_type is ast.BitXor and is_int:
+            return value ^ operand if count & 1 else value
+        if op_type in (ast.BitAnd, ast.BitOr, ast.Mod):
+            return self._bin_ops[op_type](value, operand)
+
+        if op_type in (ast.LShift, ast.RShift) and is_int and operand >= 0:
+            shift = count * operand
+            if op_type is ast.RShift:
+                return value >> min(shift, value.bit_length() + 1)
+            if bits is not None:
+                return 0 if shift >= bits else value << shift
+            self._check_budget(ast.LShift, value, shift)
+            return value << shift
+
+        if op_type is ast.Div:
+            if not use_int_div:
+                try:
+                    return value / float(operand) ** count
+                except OverflowError:
+                    if abs(operand) > 1:
+                        return value * 0.0
+                    raise
+            if operand > 0:
+                # 正整数除数：floor(floor(x/a)/b) == floor(x/(a*b))
+                if operand == 1:
+                    return value
+                if count * (operand.bit_length() - 1) > value.bit_length():
+                    return 0 if value >= 0 else -1
+                return value // operand ** count
+        return None
+
+    def compile_formula(self, expression: str, mode: str):
+        """编译含变量的表达式，返回 (闭包 fn(env), 引用的变量名集合)。
+
+        env 为变量名到数值的映射；编译结果与普通表达式共用 LRU 缓存。
+        """
         if not expression:
             raise ValueError("Empty expression")
 
         use_int_div = (mode == "Programmer")
-        return self._compute(expression, use_int_div)
+        key = ("formula", expression, use_int_div)
+        entry = self._cache.get(key)
+        if entry is None:
+            names: set = set()
+            fn = self._compile(expression, use_int_div, names)
+            entry = (fn, frozenset(names))
+            self._cache.put(key, entry)
+        return entry
+
+    def cache_info(self) -> dict:
+        """返回表达式缓存的命中、未命中、淘汰次数及容量。"""
+        return self._cache.info()
+
+    def cache_clear(self):
+        """清空表达式缓存并重置计数。"""
+        self._cache.clear()
+
+    @contextmanager
+    def limited_budget(self, max_bits: int, max_cost: int):
+        """在 with 块内收紧计算预算（不会放宽已有的限制），退出时恢复。
+
+        超出预算的计算抛出 EvaluationLimitError 而不写入缓存，之后在完整预算下仍可正常计算。
+        """
+        saved = self.max_bits, self.max_cost
+        self.max_bits = max_bits if saved[0] is None else min(saved[0], max_bits)
+        self.max_cost = max_cost if saved[1] is None else min(saved[1], max_cost)
+        try:
+            yield
+        finally:
+            self.max_bits, self.max_cost = saved
+
+    def set_cache_size(self, size: int):
+        """调整表达式缓存容量，超出部分按最久未使用淘汰；0 表示关闭缓存。"""
+        self._cache.resize(size)
 
 
     def sort_numbers(self, expression: str) -> list[Union[int, float]]:
@@ -47,58 +462,708 @@ class CalculatorModel:
         return nums
 
 
+    def iter_sorted_numbers(
+        self,
+        source: Union[str, Iterable[str]],
+        memory_budget: int = _SORT_MEMORY_BUDGET,
+    ) -> Iterator[Union[int, float]]:
+        """面向超大输入的排序：返回按升序产出数值的迭代器。
+
+        source 可以是逗号分隔的字符串，也可以是按块产出文本的可迭代对象
+        （如文件），解析规则与 sort_numbers 相同。整数与浮点数分别存放在
+        array('q') / array('d') 中；超出 int64 的整数单独保存在内存中。
+        数据量超过 memory_budget 时将已排序的分段写入临时文件，最后做
+        k 路归并。解析错误在调用时立即抛出 ValueError。
+        """
+        run_items = max(memory_budget // _SORT_BYTES_PER_ITEM, 1)
+        ints = array('q')
+        floats = array('d')
+        big_ints: list[int] = []
+        workdir = None
+        runs: list[tuple[str, str]] = []
+
+        def spill():
+            nonlocal ints, floats, workdir
+            if workdir is None:
+                workdir = tempfile.TemporaryDirectory(prefix="calc-sort-")
+            for typecode, values in (('q', ints), ('d', floats)):
+                if not values:
+                    continue
+                path = os.path.join(workdir.name, f"run{len(runs)}.{typecode}")
+                with open(path, "wb") as f:
+                    _sorted_array(values).tofile(f)
+                runs.append((path, typecode))
+            ints = array('q')
+            floats = array('d')
+
+        try:
+            for token in _iter_number_tokens(source):
+                try:
+                    value = int(token)
+                except ValueError:
+                    floats.append(float(token))
+                else:
+                    if _INT64_MIN <= value <= _INT64_MAX:
+                        ints.append(value)
+                    else:
+                        big_ints.append(value)
+                if len(ints) + len(floats) >= run_items:
+                    spill()
+        except BaseException:
+            if workdir is not None:
+                workdir.cleanup()
+            raise
+
+        big_ints.sort()
+        if workdir is None:
+            return heapq.merge(_sorted_array(ints), _sorted_array(floats), big_ints)
+
+        spill()
+        return _merge_runs(runs, big_ints, workdir)
+
+    def aggregate_numbers(
+        self,
+        source: Union[str, Iterable[str]],
+        func: str,
+        arg: Optional[float] = None,
+    ) -> Union[int, float, list[Union[int, float]]]:
+        """对逗号分隔的数值做单遍统计，不对全部数据排序。
+
+        func 取值：
+          sum / mean / count / min / max   单遍累加，内存占用不随数据量增长
+          median / percentile              arg 为百分位（0~100）；数值存入 array 后用快速选择
+                                           求顺序统计量，位置落在两项之间时线性插值
+          top / bottom                     arg 为个数 k；只保留大小为 k 的堆，
+                                           返回从大到小 / 从小到大的列表
+        source 可以是字符串或按块产出文本的可迭代对象，解析规则与 sort_numbers
+        相同。没有数值或参数无效时抛出 ValueError。
+        """
+        numbers = _parse_numbers(source)
+        if func in ("min", "max"):
+            return (min if func == "min" else max)(numbers)
+        if func in ("sum", "mean", "count"):
+            total, count = _sum_numbers(numbers)
+            if func == "count":
+                return count
+            if func == "mean":
+                if count == 0:
+                    raise ValueError("没有数值")
+                return total / count
+            return total
+        if func in ("top", "bottom"):
+            k = int(arg)
+            if k < 1:
+                raise ValueError(f"无效的个数: {arg}")
+            result = (heapq.nlargest if func == "top" else heapq.nsmallest)(k, numbers)
+            if not result:
+                raise ValueError("没有数值")
+            return result
+        if func not in ("median", "percentile"):
+            raise ValueError(f"未知的统计函数: {func}")
+
+        q = 50 if func == "median" else float(arg)
+        if not 0 <= q <= 100:
+            raise ValueError(f"无效的百分位: {arg}")
+        values = numbers if isinstance(numbers, list) else list(numbers)
+        if not values:
+            raise ValueError("没有数值")
+
+        position = (len(values) - 1) * q / 100
+        rank = int(position)
+        fraction = position - rank
+        if fraction == 0:
+            return _order_statistics(values, rank, False)[0]
+        low, high = _order_statistics(values, rank, True)
+        if func == "median":
+            return (low + high) / 2
+        return low + (high - low) * fraction
+
     def convert_time(self, expression: str) -> tuple[float, str, float, str]:
-        """将小时/分钟表达式转换为对应的另一单位。"""
+        """将小时/分钟表达式转换为对应的另一单位。
+
+        支持复合时长（如 1h30m、2.5h 15m），合计值以最后一个片段的单位表示。
+        """
         expression = expression.strip()
+        unit = expression[-1:].lower()
+        if unit not in _OTHER_TIME_UNIT:
+            raise ValueError('Invalid time expression')
 
-        if expression.lower().endswith('h'):
-            hours_str = expression[:-1].strip()
-            hours = float(hours_str)
-            minutes = hours * 60
-            return minutes, 'm', hours, 'h'
+        try:
+            original = float(expression[:-1])
+        except ValueError:
+            original = _parse_compound_duration(expression, unit)
+        converted = original * 60 if unit == 'h' else original / 60
+        return converted, _OTHER_TIME_UNIT[unit], original, unit
 
-        if expression.lower().endswith('m'):
-            minutes_str = expression[:-1].strip()
-            minutes = float(minutes_str)
-            hours = minutes / 60
-            return hours, 'h', minutes, 'm'
+    def convert_times(self, expression: str):
+        """批量时间换算：expression 为逗号或换行分隔的时长列表（空项忽略）。
 
-        raise ValueError('Invalid time expression')
+        每项的解析规则与 convert_time 相同。各项合计值与单位先收集到
+        array('d') / bytearray 中，再整体换算（项数较多且安装了 NumPy 时
+        使用数组运算）。返回 (换算后的值, 原单位下的合计值, 每项原单位组成的
+        字符串)，前两者为 ndarray 或 array('d')。格式错误时抛出 ValueError。
+        """
+        original = array('d')
+        item_units = bytearray()
+        for item in expression.replace('\n', ',').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            unit = item[-1].lower()
+            if unit not in _OTHER_TIME_UNIT:
+                raise ValueError('Invalid time expression')
+            try:
+                original.append(float(item[:-1]))
+            except ValueError:
+                original.append(_parse_compound_duration(item, unit))
+            item_units.append(ord(unit))
+        if not item_units:
+            raise ValueError('Invalid time expression')
+
+        units = item_units.decode('ascii')
+        if len(units) >= _TIME_VECTOR_THRESHOLD and _numpy() is not None:
+            totals = np.frombuffer(original, dtype=np.float64)
+            is_hour = np.frombuffer(item_units, dtype=np.uint8) == ord('h')
+            return np.where(is_hour, totals * 60, totals / 60), totals, units
 
+        converted = array('d', (
+            total * 60 if unit == 'h' else total / 60
+            for total, unit in zip(original, units)
+        ))
+        return converted, original, units
 
     # ================= 内部逻辑方法 =================
 
-    def _compute(self, expression: str, use_int_div: bool):
-        """解析字符串并计算数值"""
+    def _evaluate_chunk(self, expressions: list[str], mode: str):
+        """逐条计算并捕获错误，供批量接口使用"""
+        results = []
+        for expression in expressions:
+            try:
+                results.append((self.evaluate(expression, mode), None))
+            except ZeroDivisionError:
+                results.append((None, "div0"))
+            except EvaluationLimitError:
+                results.append((None, "limit"))
+            except Exception:
+                results.append((None, "generic"))
+        return results
+
+    def _check_budget(self, op_type, a: int, b: int):
+        """在执行整数运算前估算结果位数与代价，超出预算时抛出 EvaluationLimitError"""
+        bits, cost = _estimate_int_op(op_type, a, b)
+        if self.max_bits is not None and bits > self.max_bits:
+            raise EvaluationLimitError(f"结果约 {bits} 位，超出上限 {self.max_bits} 位")
+        if self.max_cost is not None and cost > self.max_cost:
+            raise EvaluationLimitError(f"运算代价约 {cost}，超出上限 {self.max_cost}")
+
+    def _compute(
+        self,
+        expression: str,
+        use_int_div: bool,
+        word: Optional[tuple[int, bool]] = None,
+        base: int = 10,
+    ):
+        """不含变量的表达式在解析的同时直接求值，不生成闭包"""
+        builder = self._value_builders.get((use_int_div, word))
+        if builder is None:
+            builder = _ValueBuilder(self._builder(use_int_div, None, word))
+            self._value_builders[(use_int_div, word)] = builder
+        with METRICS.time("eval"):
+            return calc_parser.parse(expression, base, builder)
+
+    def _compile(
+        self,
+        expression: str,
+        use_int_div: bool,
+        names: Optional[set] = None,
+        word: Optional[tuple[int, bool]] = None,
+        base: int = 10,
+    ):
+        """单遍解析并编译表达式；names 不为 None 时允许变量名并将其收集到该集合中，
+        word 为 (位数, 是否有符号) 时编译为定长整数运算，base 为数字字面量的进制"""
+        builder = self._builder(use_int_div, names, word)
+        with METRICS.time("parse"):
+            return calc_parser.parse(expression, base, builder)
+
+    def _builder(self, use_int_div: bool, names: Optional[set], word: Optional[tuple[int, bool]]):
+        if word is not None:
+            return _FixedBuilder(self, names, *word)
+        return _ClosureBuilder(self, use_int_div, names)
 
+
+class _ClosureBuilder:
+    """calc_parser 的构造器：解析时直接生成闭包 fn(env)，重复求值时不再逐节点分派"""
+
+    def __init__(self, model: CalculatorModel, use_int_div: bool, names: Optional[set] = None):
+        self.model = model
+        self.use_int_div = use_int_div
+        self.names = names
+        self._key = (use_int_div, names is not None)
+
+    def constant(self, value):
+        return lambda env: value
+
+    def name(self, name: str):
+        if self.names is None:
+            raise ValueError(f"不支持的变量: {name}")
+        self.names.add(name)
+        return lambda env: env[name]
+
+    def unary(self, op_type, operand):
+        func = self.model._unary_ops[op_type]
+        return lambda env: func(operand(env))
+
+    def chain(self, first, steps):
+        """左结合的运算链在一个循环中求值，链再长也不会加深调用栈"""
+        if len(steps) == 1:
+            op_type, right = steps[0]
+            func = self.binary(op_type)
+            return lambda env: func(first(env), right(env))
+        steps = [(self.binary(op_type), right) for op_type, right in steps]
+
+        def run(env):
+            value = first(env)
+            for func, right in steps:
+                value = func(value, right(env))
+            return value
+        return run
+
+    def binary(self, op_type):
+        """op_type 对应的二元函数 func(a, b)；只取决于构造器参数，在模型内复用"""
+        key = (self._key, op_type)
+        func = self.model._op_funcs.get(key)
+        if func is None:
+            func = self.model._op_funcs[key] = self._make_binary(op_type)
+        return func
+
+    def _make_binary(self, op_type):
+        # 操作数都小于 2**64（移位量小于 64）时结果不超过 129 位、代价可忽略，不做预算估算
+        check_budget = self.model._check_budget
+        if op_type is ast.Div:
+            div = operator.floordiv if self.use_int_div else operator.truediv
+            # 含变量的表达式可能作用于数组，需要逐元素检查除数
+            is_zero = _contains_zero if self.names is not None else operator.not_
+
+            def divide(a, b):
+                if is_zero(b):
+                    raise ZeroDivisionError
+                if (type(a) is int and type(b) is int
+                        and not (-_SMALL_INT < a < _SMALL_INT and -_SMALL_INT < b < _SMALL_INT)):
+                    check_budget(op_type, a, b)
+                return div(a, b)
+            return divide
+
+        func = self.model._bin_ops[op_type]
+        if op_type is ast.Mod and self.names is not None:
+            # 作用于数组时 NumPy 对 x % 0 不报错，与标量一样拒绝含 0 的除数
+            mod = func
+
+            def func(a, b):
+                if _contains_zero(b):
+                    raise ZeroDivisionError
+                return mod(a, b)
+        if op_type not in _GROWING_OPS:
+            return func
+
+        if op_type is ast.LShift:
+            def checked(a, b):
+                if type(a) is int and type(b) is int and not (-_SMALL_INT < a < _SMALL_INT and 0 <= b < 64):
+                    check_budget(op_type, a, b)
+                return func(a, b)
+            return checked
+
+        def checked(a, b):
+            if (type(a) is int and type(b) is int
+                    and not (-_SMALL_INT < a < _SMALL_INT and -_SMALL_INT < b < _SMALL_INT)):
+                check_budget(op_type, a, b)
+            return func(a, b)
+        return checked
+
+
+class _FixedBuilder(_ClosureBuilder):
+    """定长整数版本的构造器：常量和每一步结果都截断到 bits 位。
+
+    操作数不超过 64 位，每步运算都是常数时间，因此不做预算检查；
+    移位量不小于位宽时直接给出结果，不构造大整数。
+    """
+
+    def __init__(self, model: CalculatorModel, names: Optional[set], bits: int, signed: bool):
+        super().__init__(model, True, names)
+        self.bits = bits
+        self.wrap = _make_wrapper(bits, signed)
+        self._key = (bits, signed, names is not None)
+
+    def constant(self, value):
+        value = self.wrap(value)
+        return lambda env: value
+
+    def name(self, name: str):
+        load = super().name(name)
+        wrap = self.wrap
+        return lambda env: wrap(load(env))
+
+    def unary(self, op_type, operand):
+        func = self.model._unary_ops[op_type]
+        wrap = self.wrap
+        return lambda env: wrap(func(operand(env)))
+
+    def _make_binary(self, op_type):
+        wrap = self.wrap
+        if op_type is ast.Div:
+            is_zero = _contains_zero if self.names is not None else operator.not_
+
+            def divide(a, b):
+                if is_zero(b):
+                    raise ZeroDivisionError
+                return wrap(a // b)
+            return divide
+
+        if op_type is ast.LShift:
+            func = _fixed_lshift(self.bits)
+        elif op_type is ast.RShift:
+            func = _fixed_rshift(self.bits)
+        elif op_type is ast.Mod and self.names is not None:
+            # 与 _ClosureBuilder 相同：数组中含 0 的除数同样报错
+            def func(a, b):
+                if _contains_zero(b):
+                    raise ZeroDivisionError
+                return a % b
+        else:
+            func = self.model._bin_ops[op_type]
+        return lambda a, b: wrap(func(a, b))
+
+
+class _ValueBuilder:
+    """包装闭包构造器，在解析时直接计算数值；运算函数与截断规则与被包装的构造器一致"""
+
+    def __init__(self, closures: _ClosureBuilder):
+        self.closures = closures
+        self.unary_ops = closures.model._unary_ops
+        self.wrap = getattr(closures, "wrap", None)
+        if self.wrap is None:
+            self.constant = None  # 数字字面量原样作为结果，解析器不必逐个调用
+        # 所有二元运算函数预先取出，运算链中按类型直接查表
+        self.binary_funcs = {op_type: closures.binary(op_type) for op_type in closures.model._bin_ops}
+
+    def constant(self, value):
+        return value if self.wrap is None else self.wrap(value)
+
+    def name(self, name: str):
+        raise ValueError(f"不支持的变量: {name}")
+
+    def unary(self, op_type, operand):
+        value = self.unary_ops[op_type](operand)
+        return value if self.wrap is None else self.wrap(value)
+
+    def chain(self, first, steps):
+        funcs = self.binary_funcs
+        value = first
+        for op_type, right in steps:
+            value = funcs[op_type](value, right)
+        return value
+
+
+# 可能使整数规模或运算代价显著增长、需要预算检查的运算符
+_GROWING_OPS = frozenset({ast.Add, ast.Sub, ast.Mult, ast.Mod, ast.LShift})
+# 绝对值小于该值的整数运算不必估算预算
+_SMALL_INT = 1 << 64
+
+# 重复运算使用的运算符符号
+_SYMBOL_OPS = {
+    "+": ast.Add, "-": ast.Sub, "*": ast.Mult, "/": ast.Div, "%": ast.Mod,
+    "&": ast.BitAnd, "|": ast.BitOr, "^": ast.BitXor, "<<": ast.LShift, ">>": ast.RShift,
+}
+
+
+def _estimate_int_op(op_type, a: int, b: int) -> tuple[int, int]:
+    """估算整数二元运算的 (结果位数, 代价)；代价以 CPython 的 30 位数字为单位按教科书算法上界计"""
+    la = a.bit_length()
+    lb = b.bit_length()
+    da = la // 30 + 1
+    db = lb // 30 + 1
+    if op_type is ast.Mult:
+        return la + lb, da * db
+    if op_type is ast.LShift:
+        bits = la + max(b, 0)
+        return bits, bits // 30 + 1
+    if op_type in (ast.Div, ast.Mod):
+        return la, da * db
+    bits = max(la, lb) + 1
+    return bits, max(da, db)
+
+
+def wrap_int(value: int, bits: int, signed: bool = True) -> int:
+    """把整数截断到 bits 位，按有符号（补码）或无符号解释"""
+    value &= (1 << bits) - 1
+    if signed and value >> (bits - 1):
+        value -= 1 << bits
+    return value
+
+
+def _numpy():
+    """按需导入 NumPy 并记入模块变量 np，未安装时返回 None"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
         try:
-            tree = ast.parse(expression, mode='eval')
-        except SyntaxError:
-            raise ValueError("语法错误")
+            import numpy
+        except ImportError:
+            pass
+        else:
+            np = numpy
+    return np
+
+
+def _word_dtype(bits: int, signed: bool):
+    """定长整数对应的 NumPy 原生类型"""
+    return np.dtype(f"{'int' if signed else 'uint'}{bits}")
+
+
+def _make_wrapper(bits: int, signed: bool):
+    """返回截断函数：标量与 wrap_int 等价，NumPy 数组转换为对应的原生整数类型（溢出自然回绕）"""
+    mask = (1 << bits) - 1
+    sign_bit = 1 << (bits - 1) if signed else 0
+    modulus = 1 << bits
+
+    def wrap(value):
+        if type(value) is not int:
+            if np is not None and isinstance(value, np.ndarray):
+                return value.astype(_word_dtype(bits, signed), copy=False)
+            value = int(value)
+        value &= mask
+        return value - modulus if value & sign_bit else value
+    return wrap
+
+
+def _is_array(*values) -> bool:
+    return np is not None and any(isinstance(v, np.ndarray) for v in values)
+
+
+def _fixed_lshift(bits: int):
+    """定长左移：移位量不小于位宽时结果为 0"""
+    def lshift(a, b):
+        if _is_array(a, b):
+            a = np.asarray(a)
+            overflow = b >= bits
+            count = np.where(overflow, 0, b).astype(a.dtype)
+            return np.where(overflow, 0, np.left_shift(a, count))
+        return 0 if b >= bits else a << b
+    return lshift
+
+
+def _fixed_rshift(bits: int):
+    """定长右移：有符号数为算术右移，移位量不小于位宽时结果为 0 或 -1"""
+    def rshift(a, b):
+        if _is_array(a, b):
+            a = np.asarray(a)
+            overflow = b >= bits
+            shifted = np.right_shift(a, np.where(overflow, 0, b).astype(a.dtype))
+            return np.where(overflow, np.where(a < 0, -1, 0).astype(a.dtype), shifted)
+        return a >> min(b, bits)
+    return rshift
+
+
+def _contains_zero(value) -> bool:
+    """判断除数（标量或 NumPy 数组）中是否含 0"""
+    if np is not None and isinstance(value, np.ndarray):
+        return bool((value == 0).any())
+    return value == 0
+
+def _parse_compound_duration(text: str, unit: str) -> float:
+    """解析 1h30m 这类复合时长，返回以 unit 表示的合计值"""
+    total = 0.0
+    position = 0
+    for match in _TIME_PART_PATTERN.finditer(text):
+        if match.start() != position:
+            break
+        position = match.end()
+        value = float(match.group(1))
+        part_unit = match.group(2).lower()
+        if part_unit != unit:
+            value = value * 60 if part_unit == 'h' else value / 60
+        total += value
+    if position != len(text):
+        raise ValueError('Invalid time expression')
+    return total
+
+
+def _iter_number_tokens(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    """按逗号切分输入并产出去除空白后的非空片段，不构建完整的片段列表"""
+    if isinstance(source, str):
+        source = (source,)
+
+    pending = ""
+    for chunk in source:
+        text = pending + chunk
+        end = text.rfind(',')
+        if end < 0:
+            pending = text
+            continue
+        pending = text[end + 1:]
+        for match in _TOKEN_PATTERN.finditer(text, 0, end):
+            token = match.group().strip()
+            if token:
+                yield token
+
+    token = pending.strip()
+    if token:
+        yield token
+
+
+def _parse_numbers(source: Union[str, Iterable[str]]) -> Union[list, Iterator[Union[int, float]]]:
+    """按 sort_numbers 的规则解析数值：能按整数解析的为 int，否则为 float。
+
+    字符串输入用 str.split 切分后整体交给 int / float（C 层循环），纯整数或纯
+    小数的列表不必逐项捕获异常，返回列表；含空片段等情况退回逐项解析。
+    文本块迭代器返回逐个产出数值的迭代器。
+    """
+    if not isinstance(source, str):
+        return _iter_numbers(source)
+
+    parts = source.split(',')
+    try:
+        return list(map(int, parts))
+    except ValueError:
+        pass
+    try:
+        values = list(map(float, parts))
+    except ValueError:
+        return [_parse_number(part) for part in parts if part.strip()]
+    # 整数值的片段若能按整数解析则保持为 int（超过 2**53 的整数不丢精度）
+    for i, value in enumerate(values):
+        if value.is_integer():
+            try:
+                values[i] = int(parts[i])
+            except ValueError:
+                pass
+    return values
+
+
+def _parse_number(token: str) -> Union[int, float]:
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _iter_numbers(source: Iterable[str]) -> Iterator[Union[int, float]]:
+    """逐个解析文本块中的数值，不保存完整列表"""
+    for token in _iter_number_tokens(source):
+        yield _parse_number(token)
+
+
+def _sum_numbers(numbers: Union[list, Iterable[Union[int, float]]]) -> tuple[Union[int, float], int]:
+    """求和，返回 (总和, 个数)：整数精确累加，浮点数交给 math.fsum（正确舍入）"""
+    if isinstance(numbers, list):
+        floats = [v for v in numbers if type(v) is float]
+        if not floats:
+            return sum(numbers), len(numbers)
+        return sum([v for v in numbers if type(v) is not float]) + math.fsum(floats), len(numbers)
+
+    int_total = 0
+    count = 0
+    float_count = 0
+
+    def floats():
+        nonlocal int_total, count, float_count
+        for value in numbers:
+            count += 1
+            if type(value) is float:
+                float_count += 1
+                yield value
+            else:
+                int_total += value
+
+    # 迭代器输入：单遍流式求和，不保存数值
+    float_total = math.fsum(floats())
+    if float_count == 0:
+        return int_total, count
+    return int_total + float_total, count
+
+
+def _order_statistics(values: list, rank: int, with_next: bool) -> list[Union[int, float]]:
+    """返回升序排列中第 rank 位（从 0 计）的数值，with_next 时连同第 rank+1 位，不对全部数据排序。
+
+    有 NumPy 且数值能无损放入 int64 / float64 数组时用 partition，否则在列表上原地快速选择。
+    """
+    ranks = [rank, rank + 1] if with_next else [rank]
+    if len(values) >= _TIME_VECTOR_THRESHOLD and _numpy() is not None:
+        packed = np.array(values)
+        exact = packed.dtype.kind == "i" or (packed.dtype.kind == "f" and all(
+            abs(v) <= _FLOAT_EXACT_INT for v in values if type(v) is int))
+        if exact:
+            partitioned = np.partition(packed, ranks)
+            return [partitioned[r].item() for r in ranks]
+
+    low = _quickselect(values, rank)
+    if not with_next:
+        return [low]
+    # 快速选择之后 rank 之后的数值都不小于 values[rank]
+    return [low, min(values[rank + 1:])]
+
+
+def _quickselect(values: list, rank: int) -> Union[int, float]:
+    """原地随机化快速选择（Hoare 划分）：返回第 rank 小的值并把它放到 values[rank]，期望 O(n)"""
+    lo, hi = 0, len(values) - 1
+    while lo < hi:
+        pivot = values[random.randint(lo, hi)]
+        i, j = lo, hi
+        while i <= j:
+            while values[i] < pivot:
+                i += 1
+            while values[j] > pivot:
+                j -= 1
+            if i <= j:
+                values[i], values[j] = values[j], values[i]
+                i += 1
+                j -= 1
+        # 此时 values[lo..j] <= pivot <= values[i..hi]，两者之间的值都等于 pivot
+        if rank <= j:
+            hi = j
+        elif rank >= i:
+            lo = i
+        else:
+            break
+    return values[rank]
+
+
+def _sorted_array(values: array) -> array:
+    """返回排好序的同类型 array，有 NumPy 时避免装箱"""
+    if len(values) >= _TIME_VECTOR_THRESHOLD and _numpy() is not None:
+        return array(values.typecode, np.sort(np.frombuffer(values, dtype=values.typecode)).tobytes())
+    return array(values.typecode, sorted(values))
+
+
+def _iter_run(path: str, typecode: str) -> Iterator[Union[int, float]]:
+    """分块读回一个已排序的临时文件"""
+    with open(path, "rb") as f:
+        while True:
+            block = array(typecode)
+            try:
+                block.fromfile(f, _SORT_READ_BLOCK)
+            except EOFError:
+                yield from block
+                return
+            yield from block
+
 
-        return self._eval_node(tree.body, use_int_div)
+def _merge_runs(runs, big_ints, workdir) -> Iterator[Union[int, float]]:
+    """k 路归并所有分段，结束（或被关闭）时删除临时目录"""
+    try:
+        yield from heapq.merge(*(_iter_run(path, typecode) for path, typecode in runs), big_ints)
+    finally:
+        workdir.cleanup()
 
-    def _eval_node(self, node, use_int_div: bool):
-        """递归遍历 AST 节点进行计算"""
-        if isinstance(node, ast.Constant):
-            return node.value
 
-        if isinstance(node, ast.BinOp):
-            left = self._eval_node(node.left, use_int_div)
-            right = self._eval_node(node.right, use_int_div)
-            op_type = type(node.op)
+_worker_model = None
 
-            if op_type in self._bin_ops:
-                if op_type == ast.Div:
-                    if right == 0: raise ZeroDivisionError
-                    return left // right if use_int_div else left / right
-                return self._bin_ops[op_type](left, right)
 
-        if isinstance(node, ast.UnaryOp):
-            operand = self._eval_node(node.operand, use_int_div)
-            op_type = type(node.op)
-            if op_type in self._unary_ops:
-                return self._unary_ops[op_type](operand)
+def _init_worker(cache_size: int, max_bits: Optional[int], max_cost: Optional[int]):
+    """进程池初始化函数：按调用方的配置创建工作进程复用的模型实例"""
+    global _worker_model
+    _worker_model = CalculatorModel(cache_size, max_bits, max_cost)
 
-        raise ValueError(f"不支持的语法节点: {type(node)}")
 
+def _evaluate_chunk(expressions: list[str], mode: str):
+    """进程池工作函数：每个工作进程复用一个模型实例"""
+    return _worker_model._evaluate_chunk(expressions, mode)
@@ -0,0 +1,356 @@
+"""本地计算服务：多个进程共享一组预热的计算引擎。
+
+协议为按行分隔的 JSON（Unix 套接字或本机 TCP）。每行一个请求：
+    {"id": 1, "op": "evaluate", "expression": "1+2", "mode": "Standard"}
+    {"id": 2, "op": "evaluate", "expression": "FF*2", "mode": "Programmer", "base": "HEX", "word": "BYTE", "unsigned": true}
+    {"id": 3, "op": "sort", "expression": "3,1,2"}
+    {"id": 4, "op": "convert_time", "expression": "1h30m"}
+    {"id": 5, "op": "convert_base", "expression": "FF+1", "from": "HEX", "to": "BIN"}
+evaluate 与 CalculatorModel.evaluate 一致；程序员模式下数字按 base（缺省 DEC）读取，结果为十进制数值。
+每个请求按原顺序得到一行响应 {"id": ..., "result": ...}，失败时为
+{"id": ..., "error": "div0" | "limit" | "generic" | "request", "message": ...}。
+超大整数与非有限浮点数以字符串返回。
+
+同一连接上的请求可以连续发送（流水线），无需等待响应；服务端把各连接的
+请求汇集成批次交给进程池计算，事件循环只负责收发，慢请求不会阻塞其他连接。
+
+用法：
+    python server.py serve [--unix PATH | --host 127.0.0.1 --port 8765] [--workers N]
+    python server.py loadgen [--unix PATH | --host ... --port ...] [-n 20000] [-c 8] [--depth 32]
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import formatter
+from core import CalculatorCore
+from metrics import METRICS
+from model import CalculatorModel, EvaluationLimitError, WORD_SIZES
+
+_DEFAULT_HOST = "127.0.0.1"
+_DEFAULT_PORT = 8765
+# 单行请求的最大字节数（排序等请求可能很长）
+_LINE_LIMIT = 1 << 24
+# 一个批次最多包含的请求数
+_BATCH_SIZE = 64
+# 每个连接上已读入但尚未写回的请求数上限，超过后暂停读取（背压）
+_PIPELINE_DEPTH = 256
+# 每个工作进程同时排队的批次数
+_BATCHES_PER_WORKER = 2
+_OPS = frozenset({"evaluate", "sort", "convert_time", "convert_base"})
+
+
+# ================= 工作进程 =================
+
+_worker_core = None
+
+
+def _run_requests(requests):
+    """进程池工作函数：逐条执行一批请求，每个工作进程复用同一个 CalculatorCore"""
+    global _worker_core
+    if _worker_core is None:
+        _worker_core = CalculatorCore(CalculatorModel())
+    return [_run_request(_worker_core, request) for request in requests]
+
+
+def _run_request(core, request):
+    response = {"id": request.get("id")}
+    try:
+        response["result"] = _encode(_dispatch(core, request))
+    except ZeroDivisionError:
+        response.update(error="div0", message="division by zero")
+    except EvaluationLimitError as e:
+        response.update(error="limit", message=str(e))
+    except Exception as e:
+        response.update(error="generic", message=str(e))
+    return response
+
+
+def _dispatch(core, request):
+    op = request["op"]
+    expression = request["expression"]
+    model = core.model
+    if op == "evaluate":
+        mode = request.get("mode", "Standard")
+        word = request.get("word")
+        if word is not None and word not in WORD_SIZES:
+            raise ValueError(f"unknown word size: {word}")
+        base = core._base_to_int(request.get("base", "DEC"))
+        return model.evaluate(expression, mode, WORD_SIZES.get(word), not request.get("unsigned", False), base)
+    if op == "sort":
+        return model.sort_numbers(expression)
+    if op == "convert_time":
+        return model.convert_time(expression)
+    return core._convert_expression_base(expression, request.get("from", "DEC"), request.get("to", "DEC"))
+
+
+def _encode(value):
+    """把结果转换为可写入 JSON 的值"""
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, bool) or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        if formatter.is_large_int(value):
+            return "".join(formatter.iter_full_result(value, 10))
+        return value
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    return value
+
+
+# ================= 事件循环 =================
+
+class _Batcher:
+    """汇集各连接的请求，按批次提交到进程池；同时在途的批次数受限"""
+
+    def __init__(self, executor, workers):
+        self._executor = executor
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(workers * _BATCHES_PER_WORKER)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def submit(self, request):
+        """排入一个请求，返回将得到响应字典的 Future"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((request, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            # 只取已经到达的请求，不为凑满批次而等待
+            while len(batch) < _BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            METRICS.count("server_batches")
+            job = loop.run_in_executor(self._executor, _run_requests, [request for request, _ in batch])
+            job.add_done_callback(lambda job, batch=batch: self._finish(job, batch))
+
+    def _finish(self, job, batch):
+        self._slots.release()
+        try:
+            responses = job.result()
+        except (Exception, asyncio.CancelledError) as e:
+            # 工作进程异常退出或服务关闭：整批返回错误
+            responses = [{"id": request.get("id"), "error": "generic", "message": str(e)} for request, _ in batch]
+        for (_, future), response in zip(batch, responses):
+            if not future.done():
+                future.set_result(response)
+
+
+async def _handle_connection(batcher, reader, writer):
+    pending = asyncio.Queue(_PIPELINE_DEPTH)
+    sender = asyncio.get_running_loop().create_task(_write_responses(pending, writer))
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                await pending.put(_ready({"id": None, "error": "request", "message": "line too long"}))
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+            METRICS.count("server_requests")
+            request = None
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict) or "expression" not in request:
+                    raise ValueError("request must be an object with an expression")
+                if request.setdefault("op", "evaluate") not in _OPS:
+                    raise ValueError(f"unknown op: {request['op']}")
+            except ValueError as e:
+                request_id = request.get("id") if isinstance(request, dict) else None
+                await pending.put(_ready({"id": request_id, "error": "request", "message": str(e)}))
+                continue
+            await pending.put(batcher.submit(request))
+    except ConnectionError:
+        pass
+    finally:
+        await pending.put(None)
+        await sender
+        writer.close()
+
+
+def _ready(response):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(response)
+    return future
+
+
+async def _write_responses(pending, writer):
+    """按请求顺序写回响应；队列暂时为空时才 drain，连续的响应合并发送"""
+    broken = False
+    while True:
+        future = await pending.get()
+        if future is None:
+            break
+        response = await future
+        if broken:
+            continue
+        if "error" in response:
+            METRICS.error(response["error"])
+        writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        if pending.empty():
+            try:
+                await writer.drain()
+            except ConnectionError:
+                # 客户端已断开：继续消费队列，让读取端正常结束
+                broken = True
+
+
+async def serve(host=_DEFAULT_HOST, port=_DEFAULT_PORT, unix_path=None, workers=None, ready=None):
+    """启动服务直到被取消；ready 为可选回调，在开始监听后以服务器对象调用"""
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    batcher = _Batcher(executor, workers)
+    batcher.start()
+
+    async def handle(reader, writer):
+        await _handle_connection(batcher, reader, writer)
+
+    if unix_path:
+        server = await asyncio.start_unix_server(handle, path=unix_path, limit=_LINE_LIMIT)
+    else:
+        server = await asyncio.start_server(handle, host, port, limit=_LINE_LIMIT)
+    try:
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.stop()
+        executor.shutdown(wait=False, cancel_futures=True)
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+# ================= 压测客户端 =================
+
+_LOADGEN_EXPRESSIONS = [
+    {"op": "evaluate", "expression": "12+34*5-6"},
+    {"op": "evaluate", "expression": "(1+2)*(3+4)/7"},
+    {"op": "evaluate", "expression": "FF<<4", "mode": "Programmer", "base": "HEX"},
+    {"op": "evaluate", "expression": "4294967295*4294967295+1", "mode": "Programmer", "word": "QWORD"},
+    {"op": "sort", "expression": "5,3,9,1,7,2"},
+    {"op": "convert_time", "expression": "1h30m"},
+    {"op": "convert_base", "expression": "FF+10", "from": "HEX", "to": "BIN"},
+]
+
+
+async def _open(host, port, unix_path):
+    if unix_path:
+        return await asyncio.open_unix_connection(unix_path, limit=_LINE_LIMIT)
+    return await asyncio.open_connection(host, port, limit=_LINE_LIMIT)
+
+
+async def _load_connection(host, port, unix_path, count, depth, latencies, errors):
+    """在一个连接上发送 count 个请求，最多 depth 个未收到响应"""
+    reader, writer = await _open(host, port, unix_path)
+    sent_at = {}
+    window = asyncio.Semaphore(depth)
+
+    async def send():
+        for i in range(count):
+            await window.acquire()
+            request = dict(_LOADGEN_EXPRESSIONS[i % len(_LOADGEN_EXPRESSIONS)], id=i)
+            sent_at[i] = time.perf_counter()
+            writer.write(json.dumps(request).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    sender = asyncio.get_running_loop().create_task(send())
+    for _ in range(count):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        response = json.loads(line)
+        latencies.append(time.perf_counter() - sent_at.pop(response["id"]))
+        if "error" in response:
+            errors.append(response["error"])
+        window.release()
+    await sender
+    writer.close()
+    await writer.wait_closed()
+
+
+async def loadgen(host=_DEFAULT_HOST, port=_DEFAULT_PORT, unix_path=None, requests=20000, connections=8, depth=32):
+    """并发压测，返回吞吐与延迟分位数（延迟单位：微秒）"""
+    latencies = []
+    errors = []
+    per_connection = [requests // connections + (i < requests % connections) for i in range(connections)]
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _load_connection(host, port, unix_path, count, depth, latencies, errors)
+        for count in per_connection if count
+    ))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "requests_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_us": _percentile(latencies, 0.50) * 1e6,
+        "p99_us": _percentile(latencies, 0.99) * 1e6,
+    }
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地计算服务")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("serve", "启动服务"), ("loadgen", "对运行中的服务压测")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("--unix", metavar="PATH", help="Unix 套接字路径（缺省使用本机 TCP）")
+        command.add_argument("--host", default=_DEFAULT_HOST)
+        command.add_argument("--port", type=int, default=_DEFAULT_PORT)
+        if name == "serve":
+            command.add_argument("--workers", type=int, help="计算进程数（缺省为 CPU 数）")
+        else:
+            command.add_argument("-n", "--requests", type=int, default=20000)
+            command.add_argument("-c", "--connections", type=int, default=8)
+            command.add_argument("--depth", type=int, default=32, help="每个连接上未收到响应的请求数上限")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.unix, args.workers))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    stats = asyncio.run(loadgen(args.host, args.port, args.unix, args.requests, args.connections, args.depth))
+    print(
+        f"{stats['requests']} requests in {stats['seconds']:.2f} s: "
+        f"{stats['requests_per_sec']:.1f} req/s  p50 {stats['p50_us']:.1f} us  "
+        f"p99 {stats['p99_us']:.1f} us  errors {stats['errors']}"
+    )
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,27 @@
 import customtkinter as ctk
+from tkinter import TclError, filedialog
+
+# 按键事件 state 中的 Control 与 Alt（X11 的 Mod1、Windows 的 Alt）位：带这些修饰键的是快捷键而非输入
+_SHORTCUT_STATE_MASK = 0x0004 | 0x0008 | 0x20000
+# 不产生可打印字符但会修改输入框内容的按键
+_EDITING_KEYSYMS = ("BackSpace", "Delete")
 
 class CalculatorView(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.controller = None # 初始化时控制器为空，稍后注入
-        self.buttons = {}      # 存储按钮对象
+        self.buttons = {}      # 存储当前模式的按钮对象
         self.base_buttons = {} # 存储进制切换按钮
+        self.mode_frames = {}  # 各模式的按钮网格，首次使用时创建后常驻
+        self.mode_buttons = {} # 各模式的按钮对象
+        self.active_mode_frame = None
+        self._widget_state = {} # 各控件最近一次发送给 Tk 的属性（影子副本）
 
         # --- 窗口基础设置 ---
         self.title("简易计算器")
         self.geometry("340x520")
         self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # --- 1. 顶部模式切换 ---
         self.mode_segment = ctk.CTkSegmentedButton(
@@ -35,9 +46,22 @@ class CalculatorView(ctk.CTk):
         )
         self.entry.pack(fill="x")
         self.entry.insert(0, "0")
+        self.entry.bind("<KeyPress>", self.on_entry_key_press)
+        self.entry.bind("<KeyRelease>", self.on_entry_key_release)
+        # 粘贴整段交给控制器一次性处理，不走逐字符插入
+        self.entry.bind("<<Paste>>", self.on_paste)
+        self.entry.bind("<<PasteSelection>>", self.on_paste_selection)
+        self.entry.bind("<Up>", lambda event: self.on_history_key(-1))
+        self.entry.bind("<Down>", lambda event: self.on_history_key(1))
+        # Ctrl+Shift+C 复制完整结果，Ctrl+S 导出到文件（超大整数只在此时完整展开）
+        self.bind("<Control-C>", lambda event: self.controller and self.controller.handle_copy_result())
+        self.bind("<Control-s>", lambda event: self.controller and self.controller.handle_export_result())
+        # Ctrl+Enter 把上一次的运算重复 N 次
+        self.entry.bind("<Control-Return>", self.on_repeat_key)
         
         self.sub_label = ctk.CTkLabel(self.display_frame, text="", font=("Inter", 12), text_color="gray")
         self.sub_label.pack(anchor="e", padx=5)
+        self._widget_state[self.sub_label] = {"text": ""}
 
         # --- 2.5 进制切换区域 (仅程序员模式) ---
         self.base_frame = ctk.CTkFrame(self.display_frame, fg_color="transparent")
@@ -54,29 +78,131 @@ class CalculatorView(ctk.CTk):
         """注入控制器"""
         self.controller = controller
 
+    def on_close(self):
+        """关闭窗口前让控制器回收后台进程"""
+        if self.controller:
+            self.controller.shutdown()
+        self.destroy()
+
     def on_mode_segment_click(self, value):
         """当模式切换被点击时，通知控制器"""
         if self.controller:
             self.controller.handle_mode_change(value)
 
-    def update_display(self, main_text, sub_text=None):
-        """更新主显示屏"""
+    def on_entry_key_press(self, event):
+        """按键作用到输入框之前，先把控制器中尚未同步的内容写入输入框"""
+        if self.controller:
+            self.controller.flush_display()
+
+    def on_paste(self, event):
+        """读取剪贴板，替换选区或插入到光标处，阻止 Tk 默认的插入"""
+        if self.controller:
+            try:
+                text = self.clipboard_get()
+            except TclError:
+                return "break"
+            self.controller.flush_display()
+            self.controller.handle_paste(text, *self.get_edit_range())
+            return "break"
+
+    def on_paste_selection(self, event):
+        """X11 中键粘贴 PRIMARY 选区：插入到鼠标所在位置"""
+        if self.controller:
+            try:
+                text = self.selection_get()
+            except TclError:
+                return "break"
+            self.controller.flush_display()
+            position = self.entry.index(f"@{event.x}")
+            self.controller.handle_paste(text, position, position)
+            return "break"
+
+    def on_entry_key_release(self, event):
+        """键盘直接编辑输入框时通知控制器；快捷键、回车、Tab、Esc 等不修改内容的按键不算编辑"""
+        if not self.controller or event.state & _SHORTCUT_STATE_MASK:
+            return
+        if (event.char and event.char.isprintable()) or event.keysym in _EDITING_KEYSYMS:
+            self.controller.handle_text_edited()
+
+    def on_history_key(self, step):
+        """上下键浏览历史记录"""
+        if self.controller:
+            self.controller.handle_history_step(step)
+        return "break"
+
+    def on_repeat_key(self, event):
+        """询问重复次数后通知控制器"""
+        if self.controller:
+            count = self.ask_repeat_count()
+            if count:
+                self.controller.handle_repeat(count)
+        return "break"
+
+    def ask_repeat_count(self):
+        text = ctk.CTkInputDialog(text="重复上一次运算的次数：", title="重复运算").get_input()
+        try:
+            return int(text) if text else None
+        except ValueError:
+            return None
+
+    def update_sub_label(self, text):
+        """只更新副标签（实时预览等）"""
+        self._configure_changed(self.sub_label, text=text)
+
+    def _configure_changed(self, widget, **options):
+        """与影子副本比较，只把实际变化的属性发送给 Tk，避免无谓的重绘"""
+        shadow = self._widget_state.setdefault(widget, {})
+        changed = {key: value for key, value in options.items() if key not in shadow or shadow[key] != value}
+        if changed:
+            widget.configure(**changed)
+            shadow.update(changed)
+
+    def update_display(self, main_text, sub_text=None, cursor=None):
+        """更新主显示屏；cursor 为插入光标位置，默认在末尾"""
         self.entry.delete(0, "end")
         self.entry.insert(0, main_text)
+        if cursor is not None:
+            self.entry.icursor(cursor)
         if sub_text is not None:
-            self.sub_label.configure(text=sub_text)
+            self._configure_changed(self.sub_label, text=sub_text)
 
     def get_display_text(self):
         """Get current text from the main display."""
         return self.entry.get()
 
+    def get_edit_range(self):
+        """当前选区的 (起点, 终点)；没有选区时为插入光标处的空区间"""
+        if self.entry.select_present():
+            return self.entry.index("sel.first"), self.entry.index("sel.last")
+        position = self.entry.index("insert")
+        return position, position
+
+    def set_clipboard(self, text):
+        self.clipboard_clear()
+        self.clipboard_append(text)
+
+    def ask_export_path(self):
+        return filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text", "*.txt")])
+
     def resize_window(self, width, height):
         self.geometry(f"{width}x{height}")
 
-    def clear_button_frame(self):
-        for widget in self.button_frame.winfo_children():
-            widget.destroy()
-        self.buttons = {}
+    def show_mode_grid(self, mode_name, buttons, cols):
+        """显示指定模式的按钮网格：首次调用时创建，之后直接切换已缓存的框架"""
+        frame = self.mode_frames.get(mode_name)
+        if frame is None:
+            frame = ctk.CTkFrame(self.button_frame, fg_color="transparent")
+            self.mode_frames[mode_name] = frame
+            self.mode_buttons[mode_name] = {}
+            self.buttons = self.mode_buttons[mode_name]
+            self._create_grid(frame, buttons, cols)
+
+        if self.active_mode_frame is not frame:
+            if self.active_mode_frame is not None:
+                self.active_mode_frame.pack_forget()
+            frame.pack(fill="both", expand=True)
+            self.active_mode_frame = frame
+        self.buttons = self.mode_buttons[mode_name]
 
     def _setup_base_buttons(self):
         """创建 HEX, DEC, OCT, BIN 按钮"""
@@ -95,6 +221,36 @@ class CalculatorView(ctk.CTk):
             )
             btn.pack(fill="x", pady=1)
             self.base_buttons[base] = btn
+            self._widget_state[btn] = {"fg_color": "transparent", "text_color": ("gray20", "gray80")}
+
+        # 字长与有无符号选择
+        word_row = ctk.CTkFrame(self.base_frame, fg_color="transparent")
+        word_row.pack(fill="x", pady=(4, 0))
+        self.word_menu = ctk.CTkOptionMenu(
+            word_row,
+            values=["不限位宽", "QWORD", "DWORD", "WORD", "BYTE"],
+            height=24,
+            width=110,
+            font=("Inter", 12),
+            command=lambda _: self.on_word_option_change()
+        )
+        self.word_menu.pack(side="left")
+        self.unsigned_var = ctk.BooleanVar(value=False)
+        self.unsigned_check = ctk.CTkCheckBox(
+            word_row,
+            text="无符号",
+            variable=self.unsigned_var,
+            font=("Inter", 12),
+            checkbox_width=18,
+            checkbox_height=18,
+            command=self.on_word_option_change
+        )
+        self.unsigned_check.pack(side="left", padx=(10, 0))
+
+    def on_word_option_change(self):
+        """字长或有无符号改变时通知控制器"""
+        if self.controller:
+            self.controller.handle_word_size_change(self.word_menu.get(), not self.unsigned_var.get())
 
     def update_base_selection(self, active_base):
         """高亮当前选中的进制按钮"""
@@ -108,9 +264,9 @@ class CalculatorView(ctk.CTk):
         }
         for base, btn in self.base_buttons.items():
             if base == active_base:
-                btn.configure(fg_color=colors["active"], text_color=text_colors["active"])
+                self._configure_changed(btn, fg_color=colors["active"], text_color=text_colors["active"])
             else:
-                btn.configure(fg_color=colors["inactive"], text_color=text_colors["inactive"])
+                self._configure_changed(btn, fg_color=colors["inactive"], text_color=text_colors["inactive"])
 
     def set_base_frame_visibility(self, visible):
         """控制进制切换区域的显示/隐藏"""
@@ -137,15 +293,14 @@ class CalculatorView(ctk.CTk):
         for char, btn in self.buttons.items():
             if char in hex_chars + digits:
                 state = "normal" if char in valid_chars else "disabled"
-                btn.configure(state=state)
+                self._configure_changed(btn, state=state)
             
             # 程序员模式通常不支持小数点
             if char == ".":
-                btn.configure(state="disabled")
+                self._configure_changed(btn, state="disabled")
 
     def setup_standard_buttons(self):
         self.set_base_frame_visibility(False)
-        self.clear_button_frame()
         buttons = [
             ('CLEAR', 0, 0, "danger"), ('Backspace', 0, 1, "action", 2), ('/', 0, 3, "action"),
             ('7', 1, 0, "normal"), ('8', 1, 1, "normal"), ('9', 1, 2, "normal"), ('*', 1, 3, "action"),
@@ -153,12 +308,11 @@ class CalculatorView(ctk.CTk):
             ('1', 3, 0, "normal"), ('2', 3, 1, "normal"), ('3', 3, 2, "normal"), ('+', 3, 3, "action"),
             ('0', 4, 0, "normal", 2), ('.', 4, 2, "normal"), ('=', 4, 3, "success")
         ]
-        self._create_grid(buttons, cols=4)
+        self.show_mode_grid("Standard", buttons, cols=4)
 
     def setup_programmer_buttons(self):
         """程序员模式：按照指定布局排列按钮"""
         self.set_base_frame_visibility(True)
-        self.clear_button_frame()
         buttons = [
             ("A", 0, 0, "hex", 1), ("<<", 0, 1, "action"), (">>", 0, 2, "action"),
             ("CLEAR", 0, 3, "danger"), ("Backspace", 0, 4, "action"),
@@ -173,27 +327,26 @@ class CalculatorView(ctk.CTk):
             ("F", 5, 0, "hex", 1), ("+/-", 5, 1, "action"), ("0", 5, 2, "normal"),
             (".", 5, 3, "normal"), ("=", 5, 4, "success"),
         ]
-        self._create_grid(buttons, cols=5)
+        self.show_mode_grid("Programmer", buttons, cols=5)
 
     def setup_time_buttons(self):
         """设置时间模式按钮"""
         self.set_base_frame_visibility(False)
-        self.clear_button_frame()
         buttons = [
             ('CLEAR', 0, 0, "danger"), ('Backspace', 0, 1, "action", 2), ('=', 0, 3, "success"),
             ('1', 1, 0, "normal"), ('2', 1, 1, "normal"), ('3', 1, 2, "normal"), ('h', 1, 3, "time"),
             ('4', 2, 0, "normal"), ('5', 2, 1, "normal"), ('6', 2, 2, "normal"), ('m', 2, 3, "time"),
             ('7', 3, 0, "normal"), ('8', 3, 1, "normal"), ('9', 3, 2, "normal"), ('.', 3, 3, "normal"),
-            ('0', 4, 0, "normal", 3)
+            ('0', 4, 0, "normal", 3), (',', 4, 3, "normal")
         ]
-        self._create_grid(buttons, cols=4)
+        self.show_mode_grid("Time", buttons, cols=4)
 
-    def _create_grid(self, buttons, cols):
+    def _create_grid(self, frame, buttons, cols):
         rows = max((btn[1] for btn in buttons), default=-1) + 1
         for i in range(cols):
-            self.button_frame.grid_columnconfigure(i, weight=1)
+            frame.grid_columnconfigure(i, weight=1)
         for i in range(rows):
-            self.button_frame.grid_rowconfigure(i, weight=1)
+            frame.grid_rowconfigure(i, weight=1)
 
         for btn_data in buttons:
             text = btn_data[0]
@@ -202,9 +355,9 @@ class CalculatorView(ctk.CTk):
             style = btn_data[3]
             colspan = btn_data[4] if len(btn_data) > 4 else 1
             state = btn_data[5] if len(btn_data) > 5 else "normal"
-            self.create_button(text, row, col, colspan, style, state)
+            self.create_button(frame, text, row, col, colspan, style, state)
 
-    def create_button(self, text, row, col, colspan, style, state="normal"):
+    def create_button(self, frame, text, row, col, colspan, style, state="normal"):
         colors = {
             "danger": ("#FF6B6B", "#EE5253"),
             "action": ("#54a0ff", "#2e86de"),
@@ -217,7 +370,7 @@ class CalculatorView(ctk.CTk):
         display_text = "C" if text == "CLEAR" else "⌫" if text == "Backspace" else text
 
         btn = ctk.CTkButton(
-            self.button_frame,
+            frame,
             text=display_text,
             corner_radius=8,
             font=("Inter", 18, "bold"),
@@ -227,3 +380,4 @@ class CalculatorView(ctk.CTk):
         )
         btn.grid(row=row, column=col, columnspan=colspan, padx=3, pady=3, sticky="nsew")
         self.buttons[text] = btn
+        self._widget_state[btn] = {"state": state}
@@ -0,0 +1,147 @@
+"""命名变量与公式。
+
+公式是引用其他名称的表达式（rate = 1.07，total = base*rate）。定义时由
+calc_parser 在解析过程中收集引用的名称建立依赖图（同时维护反向边），拒绝形成循环的定义。
+修改某个名称后只按拓扑顺序重新计算它及其传递依赖者，其余公式的值保持不变。
+"""
+from typing import Iterator, Union
+
+# 名称未定义或依赖出错时记录在公式上的错误
+_UNDEFINED = "未定义的名称: {}"
+_DEPENDENCY_FAILED = "依赖的公式出错: {}"
+
+
+class CyclicDependencyError(ValueError):
+    """公式之间存在循环引用"""
+
+
+class Workspace:
+    def __init__(self, model, mode: str = "Standard"):
+        self.model = model
+        self.mode = mode
+        self._formulas = {}    # 名称 -> (表达式, 编译后的闭包, 引用的名称)
+        self._dependents = {}  # 名称 -> 直接引用它的公式名集合（名称可以尚未定义）
+        self._values = {}      # 名称 -> 当前值
+        self._errors = {}      # 名称 -> 计算时的异常
+        self.recomputed = 0    # 最近一次修改重新计算的公式数
+        self.version = 0       # 每次定义/删除递增，供调用方判断缓存的结果是否过期
+
+    # ================= 公共接口 =================
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._formulas
+
+    def __len__(self) -> int:
+        return len(self._formulas)
+
+    def names(self) -> Iterator[str]:
+        return iter(self._formulas)
+
+    def expression(self, name: str) -> str:
+        return self._formulas[name][0]
+
+    def define(self, name: str, expression: str) -> Union[int, float]:
+        """定义或修改名称，重新计算受影响的公式并返回该名称的新值（出错时抛出对应异常）"""
+        if not name.isidentifier():
+            raise ValueError(f"无效的名称: {name!r}")
+        fn, deps = self.model.compile_formula(expression, self.mode)
+        if name in deps or self._depends_on(deps, name):
+            raise CyclicDependencyError(f"循环引用: {name}")
+
+        old = self._formulas.get(name)
+        if old is not None:
+            for dep in old[2]:
+                self._dependents[dep].discard(name)
+        for dep in deps:
+            self._dependents.setdefault(dep, set()).add(name)
+        self._formulas[name] = (expression, fn, deps)
+
+        self._recompute_from(name)
+        return self.value(name)
+
+    def remove(self, name: str):
+        """删除名称；引用它的公式随之变为未定义错误"""
+        _, _, deps = self._formulas.pop(name)
+        for dep in deps:
+            self._dependents[dep].discard(name)
+        self._values.pop(name, None)
+        self._errors.pop(name, None)
+        self._recompute_from(name)
+
+    def value(self, name: str) -> Union[int, float]:
+        """名称的当前值；计算出错时重新抛出当时的异常"""
+        error = self._errors.get(name)
+        if error is not None:
+            raise error
+        try:
+            return self._values[name]
+        except KeyError:
+            raise ValueError(_UNDEFINED.format(name)) from None
+
+    def evaluate(self, expression: str) -> Union[int, float]:
+        """用当前各名称的值计算一次性表达式（不定义新名称）"""
+        fn, deps = self.model.compile_formula(expression, self.mode)
+        for dep in deps:
+            self.value(dep)
+        return fn(self._values)
+
+    # ================= 内部逻辑方法 =================
+
+    def _depends_on(self, names, target: str) -> bool:
+        """names 中的公式是否（传递地）引用了 target"""
+        stack = list(names)
+        seen = set()
+        while stack:
+            name = stack.pop()
+            if name == target:
+                return True
+            if name in seen:
+                continue
+            seen.add(name)
+            formula = self._formulas.get(name)
+            if formula is not None:
+                stack.extend(formula[2])
+        return False
+
+    def _affected_order(self, name: str) -> list[str]:
+        """name 及其传递依赖者的拓扑顺序（迭代 DFS 的逆后序，避免深链递归）"""
+        order = []
+        seen = {name}
+        stack = [(name, iter(self._dependents.get(name, ())))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(self._dependents.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        order.reverse()
+        return order
+
+    def _recompute_from(self, name: str):
+        self.version += 1
+        order = self._affected_order(name)
+        self.recomputed = 0
+        for node in order:
+            if node in self._formulas:
+                self._recompute(node)
+                self.recomputed += 1
+
+    def _recompute(self, name: str):
+        _, fn, deps = self._formulas[name]
+        self._values.pop(name, None)
+        self._errors.pop(name, None)
+        for dep in deps:
+            if dep in self._errors:
+                self._errors[name] = ValueError(_DEPENDENCY_FAILED.format(dep))
+                return
+            if dep not in self._values:
+                self._errors[name] = ValueError(_UNDEFINED.format(dep))
+                return
+        try:
+            self._values[name] = fn(self._values)
+        except Exception as e:
+            self._errors[name] = e